@@ -22,7 +22,7 @@ from services.media_service import (
     process_google_photos_media, serve_uploaded_file, handle_google_photos_download,
     initialize_upload_folder, extract_images_from_posts, cleanup_orphaned_media
 )
-from db.database import get_db, close_db, init_db, init_oauth_on_import
+from db.database import get_db, close_db, init_db, init_oauth_on_import, init_app as init_db_app
 from db.queries import (
     get_setting, update_setting, log_activity, log_email, update_email_log,
     get_user_by_magic_token, get_user_by_id, get_all_users, get_users_with_emails,
@@ -73,6 +73,30 @@ class CustomSessionInterface(SecureCookieSessionInterface):
 
 app.session_interface = CustomSessionInterface()
 
+# Use orjson for jsonify()/request.get_json() when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    from flask.json.provider import DefaultJSONProvider
+
+    class OrjsonProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if kwargs.get('sort_keys', self.sort_keys):
+                option |= orjson.OPT_SORT_KEYS
+            if kwargs.get('indent'):
+                option |= orjson.OPT_INDENT_2
+            # Datetimes fall through to Flask's default so the HTTP date format is kept
+            return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+
 # If we have a URL prefix, we need to handle it properly
 if app.config['URL_PREFIX']:
     from werkzeug.middleware.dispatcher import DispatcherMiddleware
@@ -111,8 +135,8 @@ def register_utility_processor():
 def register_content_processor():
     return content_processor()
 
-# Register database teardown handler
-app.teardown_appcontext(close_db)
+# Register database teardown handler and cache the database path
+init_db_app(app)
 
 # Register blueprints
 app.register_blueprint(main_bp)
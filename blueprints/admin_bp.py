@@ -4,9 +4,9 @@ Admin Blueprint - Contains all admin-related routes
 import sqlite3
 import uuid
 from flask import Blueprint, jsonify, request, render_template, render_template_string, flash, session, abort
-from db.database import get_db
+from db.database import get_db, get_write_db
 from db.queries import (
-    get_setting, update_setting, log_activity,
+    get_setting, update_setting, update_settings_batch, log_activity,
     get_user_by_id, get_all_users, create_user, delete_user, 
     toggle_user_admin, update_user_email_notifications,
     get_all_filter_tags, create_filter_tag, delete_filter_tag,
@@ -178,10 +178,7 @@ def admin_console():
         email_notifications = request.form.get('email_notifications', 'all')
         magic_token = uuid.uuid4().hex
         try:
-            cursor = db.execute('INSERT INTO users (name, email, magic_token, email_notifications) VALUES (?, ?, ?, ?)', 
-                               (name, email, magic_token, email_notifications))
-            user_id = cursor.lastrowid
-            db.commit()
+            user_id = create_user(name, email, magic_token, email_notifications)
             
             # Send welcome email if notifications are enabled
             if get_setting('notifications_enabled', 'false').lower() == 'true':
@@ -208,9 +205,7 @@ def remove_user(user_id):
     if requires_admin_auth():
         return redirect_to_admin_login()
     
-    db = get_db()
-    db.execute('DELETE FROM users WHERE id = ?', (user_id,))
-    db.commit()
+    delete_user(user_id)
     flash('User removed.', 'info')
     return redirect(url_for_with_prefix('admin.admin_console'))
 
@@ -222,14 +217,13 @@ def toggle_admin_status(user_id):
         if requires_admin_auth():
             return jsonify({'error': 'Unauthorized'}), 401
         
-        db = get_db()
-        user = db.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        new_admin_status = 1 if not user['is_admin'] else 0
-        db.execute('UPDATE users SET is_admin = ? WHERE id = ?', (new_admin_status, user_id))
-        db.commit()
+        with get_write_db() as db:
+            user = db.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+            
+            new_admin_status = 1 if not user['is_admin'] else 0
+            db.execute('UPDATE users SET is_admin = ? WHERE id = ?', (new_admin_status, user_id))
         
         return jsonify({
             'success': True,
@@ -248,11 +242,9 @@ def update_user_notifications(user_id):
     if requires_admin_auth():
         return jsonify({'error': 'Unauthorized'}), 401
     
-    db = get_db()
     email_notifications = request.form.get('email_notifications', 'all')
     
-    db.execute('UPDATE users SET email_notifications = ? WHERE id = ?', (email_notifications, user_id))
-    db.commit()
+    update_user_email_notifications(user_id, email_notifications)
     
     return jsonify({'success': True})
 
@@ -263,7 +255,6 @@ def add_filter_tag():
     if requires_admin_auth():
         return redirect_to_admin_login()
     
-    db = get_db()
     name = request.form.get('name', '').strip().lower()
     display_name = request.form.get('display_name', '').strip()
     color = request.form.get('color', '#3b82f6')
@@ -273,9 +264,7 @@ def add_filter_tag():
         return redirect(url_for_with_prefix('admin.admin_console'))
     
     try:
-        db.execute('INSERT INTO filter_tags (name, display_name, color) VALUES (?, ?, ?)',
-                  (name, display_name, color))
-        db.commit()
+        create_filter_tag(name, display_name, color)
         flash('Filter tag added!', 'success')
     except sqlite3.IntegrityError:
         flash('Tag name already exists!', 'danger')
@@ -289,9 +278,7 @@ def remove_filter_tag(tag_id):
     if requires_admin_auth():
         return redirect_to_admin_login()
     
-    db = get_db()
-    db.execute('DELETE FROM filter_tags WHERE id = ?', (tag_id,))
-    db.commit()
+    delete_filter_tag(tag_id)
     flash('Filter tag removed!', 'info')
     return redirect(url_for_with_prefix('admin.admin_console'))
 
@@ -312,17 +299,18 @@ def admin_settings():
             'smtp_use_tls', 'email_from_name', 'email_from_address', 'notifications_enabled'
         ]
         
+        settings_data = {}
         for setting_key in settings_to_update:
             if setting_key in request.form:
                 value = request.form[setting_key]
-                # Handle checkboxes
+                # Handle checkboxes (update_settings_batch stores them as 'true'/'false')
                 if setting_key in ['smtp_use_tls', 'notifications_enabled']:
-                    value = 'true' if request.form.get(setting_key) else 'false'
-                
-                db.execute('UPDATE settings SET value = ?, updated = CURRENT_TIMESTAMP WHERE key = ?',
-                          (value, setting_key))
+                    value = bool(request.form.get(setting_key))
+                settings_data[setting_key] = value
         
-        db.commit()
+        # Goes through the same path as every other settings write, which also
+        # drops this request's cached settings
+        update_settings_batch(settings_data)
         flash('Settings updated successfully!', 'success')
         return redirect(url_for_with_prefix('admin.admin_settings'))
     
@@ -410,14 +398,8 @@ def edit_email_template(template_id):
         variables = request.form.get('variables', '')
         is_active = 1 if request.form.get('is_active') else 0
         
-        db.execute('''UPDATE email_templates 
-                     SET display_name = ?, description = ?, subject_template = ?, 
-                         html_template = ?, plain_template = ?, variables = ?, 
-                         is_active = ?, updated = CURRENT_TIMESTAMP 
-                     WHERE id = ?''',
-                  (display_name, description, subject_template, html_template, 
-                   plain_template, variables, is_active, template_id))
-        db.commit()
+        update_email_template(template_id, display_name, description, subject_template,
+                              html_template, plain_template, variables, is_active)
         
         flash('Email template updated successfully!', 'success')
         return redirect(url_for_with_prefix('admin.admin_email_templates'))
@@ -623,13 +605,10 @@ You can update your notification preferences anytime.
         
         # Insert templates
         created_count = 0
-        for template in default_templates:
-            # Check if template already exists
-            existing = db.execute('SELECT id FROM email_templates WHERE template_name = ?', 
-                                (template['template_name'],)).fetchone()
-            
-            if not existing:
-                db.execute('''INSERT INTO email_templates 
+        with get_write_db() as db:
+            for template in default_templates:
+                # template_name is UNIQUE, so existing templates are skipped
+                cursor = db.execute('''INSERT OR IGNORE INTO email_templates 
                     (template_name, display_name, description, subject_template, 
                      html_template, plain_template, variables, is_active)
                     VALUES (?, ?, ?, ?, ?, ?, ?, 1)''',
@@ -637,9 +616,7 @@ You can update your notification preferences anytime.
                      template['description'], template['subject_template'],
                      template['html_template'], template['plain_template'], 
                      template['variables']))
-                created_count += 1
-        
-        db.commit()
+                created_count += cursor.rowcount
         
         return jsonify({
             'success': True, 
@@ -724,15 +701,7 @@ def admin_about_us_edit():
             content = request.form.get('content', '')
             
             # Save to database
-            db = get_db()
-            
-            # Create table if it doesn't exist
-            db.execute('''CREATE TABLE IF NOT EXISTS about_us 
-                         (id INTEGER PRIMARY KEY, content TEXT, updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-            
-            # Insert new content
-            db.execute('INSERT INTO about_us (content) VALUES (?)', (content,))
-            db.commit()
+            update_about_us_content(content)
             
             flash('About Us page updated successfully!', 'success')
             return redirect(url_for_with_prefix('admin.admin_about_us_edit'))
@@ -745,10 +714,6 @@ def admin_about_us_edit():
     try:
         db = get_db()
         
-        # Create table if it doesn't exist
-        db.execute('''CREATE TABLE IF NOT EXISTS about_us 
-                     (id INTEGER PRIMARY KEY, content TEXT, updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        
         # Get the latest content
         result = db.execute('SELECT content FROM about_us ORDER BY id DESC LIMIT 1').fetchone()
         
@@ -905,12 +870,13 @@ def admin_email_logs():
         has_next = page < total_pages
         
         # Get summary statistics
-        stats = {
-            'total_sent': db.execute("SELECT COUNT(*) as count FROM email_logs WHERE status = 'sent'").fetchone()['count'],
-            'total_failed': db.execute("SELECT COUNT(*) as count FROM email_logs WHERE status = 'failed'").fetchone()['count'],
-            'today_sent': db.execute("SELECT COUNT(*) as count FROM email_logs WHERE status = 'sent' AND date(sent_at) = date('now', 'localtime')").fetchone()['count'],
-            'yesterday_sent': db.execute("SELECT COUNT(*) as count FROM email_logs WHERE status = 'sent' AND date(sent_at) = date('now', 'localtime', '-1 day')").fetchone()['count']
-        }
+        stats = dict(db.execute('''
+            SELECT COUNT(CASE WHEN status = 'sent' THEN 1 END) as total_sent,
+                   COUNT(CASE WHEN status = 'failed' THEN 1 END) as total_failed,
+                   COUNT(CASE WHEN status = 'sent' AND date(sent_at) = date('now', 'localtime') THEN 1 END) as today_sent,
+                   COUNT(CASE WHEN status = 'sent' AND date(sent_at) = date('now', 'localtime', '-1 day') THEN 1 END) as yesterday_sent
+            FROM email_logs
+        ''').fetchone())
         
         return render_template('admin_email_logs.html',
                              email_logs=email_logs,
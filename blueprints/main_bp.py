@@ -1,7 +1,9 @@
-from flask import Blueprint, render_template, request, jsonify, abort, session, flash, g, render_template_string
-from db.database import get_db
+from flask import Blueprint, render_template, request, jsonify, abort, session, flash, g, render_template_string, make_response
+from db.database import get_db, get_write_db
 from db.queries import (
-    log_activity, get_setting
+    log_activity, get_setting, create_post, get_reaction_counts_for_posts,
+    get_user_by_magic_token, update_user_last_login, create_comment,
+    create_default_user_notification_preferences, update_user_notification_preferences
 )
 from services.email_service import send_notification_email
 from services.media_service import (
@@ -11,12 +13,48 @@ from services.media_service import (
 )
 from utils.timezone_utils import get_pacific_now
 from utils.url_utils import redirect, url_for_with_prefix as url_for
-import sqlite3
 import traceback
 
 # Create the Blueprint
 main_bp = Blueprint('main', __name__)
 
+# Static debug page for /test-polling, built once at import
+_TEST_POLLING_HTML = b'''
+    <!DOCTYPE html>
+    <html><head><title>Test Polling</title></head><body>
+    <h1>Test Google Photos Polling</h1>
+    <button onclick="testPolling()">Test Poll Session</button>
+    <div id="results"></div>
+    <script>
+        async function testPolling() {
+            const sessionId = 'e94bd304-1ab4-440f-a4bc-54094baae781';
+            try {
+                console.log('Testing polling...');
+                const response = await fetch(`/api/google-photos/poll-session/${sessionId}`);
+                const pollData = await response.json();
+                console.log('Poll response:', pollData);
+                document.getElementById('results').innerHTML = '<pre>' + JSON.stringify(pollData, null, 2) + '</pre>';
+                
+                if (pollData.selectedItems && pollData.selectedItems.length > 0) {
+                    console.log('Testing download...');
+                    const downloadResponse = await fetch('/api/google-photos/download-selected', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ selectedItems: pollData.selectedItems })
+                    });
+                    const downloadData = await downloadResponse.json();
+                    console.log('Download response:', downloadData);
+                    document.getElementById('results').innerHTML += '<h3>Download:</h3><pre>' + JSON.stringify(downloadData, null, 2) + '</pre>';
+                }
+            } catch (error) {
+                console.error('Error:', error);
+                document.getElementById('results').innerHTML = 'Error: ' + error.message;
+            }
+        }
+    </script>
+    </body></html>
+'''
+
 @main_bp.route('/')
 def home():
     """Home page route"""
@@ -45,24 +83,17 @@ def create_post_route(magic_token=None):
             abort(403)  # Only admins can create posts
         
         # Update last login time with Pacific Time
-        db.execute('UPDATE users SET last_login = ? WHERE id = ?', (get_pacific_now(), user['id']))
-        db.commit()
+        update_user_last_login(user['id'])
     
     if request.method == 'POST':
         title = request.form['title']
         content = request.form['content']
         tags = request.form.get('tags', '').strip()
 
-        db = get_db()
         author_id = user['id'] if user else None
         
-        # Insert post with tags and Pacific Time
-        cursor = db.execute(
-            "INSERT INTO posts (title, content, author_id, tags, created) VALUES (?, ?, ?, ?, ?)",
-            (title, content, author_id, tags, get_pacific_now())
-        )
-        post_id = cursor.lastrowid
-        db.commit()
+        # Insert the post and its post_tags rows in one transaction
+        post_id = create_post(title, content, author_id, tags)
         
         # Log post creation activity
         if user:
@@ -155,7 +186,7 @@ def uploaded_file(filename):
 def posts(magic_token, year_month=None, show_type=None, tag_filter=None):
     """View posts with magic link authentication"""
     db = get_db()
-    user = db.execute('SELECT * FROM users WHERE magic_token = ?', (magic_token,)).fetchone()
+    user = get_user_by_magic_token(magic_token)
     if not user:
         abort(403)
     
@@ -166,8 +197,8 @@ def posts(magic_token, year_month=None, show_type=None, tag_filter=None):
     last_login = user['last_login'] if user['last_login'] else '1970-01-01 00:00:00'
     
     # Update last login time
-    db.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user['id'],))
-    db.commit()
+    with get_write_db() as db:
+        db.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user['id'],))
     
     # Get posts based on filter type
     if year_month:
@@ -178,22 +209,22 @@ def posts(magic_token, year_month=None, show_type=None, tag_filter=None):
                 SELECT p.*, u.name as author_name 
                 FROM posts p 
                 LEFT JOIN users u ON p.author_id = u.id
-                WHERE strftime('%Y-%m', p.created) = ? 
+                WHERE substr(p.created, 1, 7) = ? 
                 ORDER BY p.id DESC
             ''', (year_month,)).fetchall()
             current_view = f"month-{year_month}"
         except ValueError:
             abort(404)
     elif tag_filter:
-        # Show posts filtered by tag
+        # Show posts filtered by tag (post_tags primary key lookup)
         posts = db.execute('''
             SELECT p.*, u.name as author_name 
-            FROM posts p 
+            FROM post_tags t 
+            JOIN posts p ON p.id = t.post_id 
             LEFT JOIN users u ON p.author_id = u.id
-            WHERE p.tags IS NOT NULL AND p.tags != '' 
-            AND (p.tags = ? OR p.tags LIKE ? OR p.tags LIKE ? OR p.tags LIKE ?)
+            WHERE t.tag = ?
             ORDER BY p.id DESC
-        ''', (tag_filter, f'{tag_filter},%', f'%,{tag_filter},%', f'%,{tag_filter}')).fetchall()
+        ''', (tag_filter.strip().lower(),)).fetchall()
         current_view = f"tag-{tag_filter}"
     elif show_type == 'all':
         # Show all posts
@@ -240,12 +271,12 @@ def posts(magic_token, year_month=None, show_type=None, tag_filter=None):
     
     # Get available months that have posts
     available_months = db.execute('''
-        SELECT DISTINCT strftime('%Y-%m', created) as month,
-               strftime('%Y', created) as year,
-               strftime('%m', created) as month_num,
+        SELECT substr(created, 1, 7) as month,
+               substr(created, 1, 4) as year,
+               substr(created, 6, 2) as month_num,
                COUNT(*) as post_count
         FROM posts 
-        GROUP BY strftime('%Y-%m', created) 
+        GROUP BY substr(created, 1, 7) 
         ORDER BY month DESC
     ''').fetchall()
     
@@ -278,38 +309,28 @@ def posts(magic_token, year_month=None, show_type=None, tag_filter=None):
                 ''', (post['id'], user['id'], user['id'], post['id'])).fetchall()
             comments_by_post[post['id']] = post_comments
     
-    # Get reaction data for all posts
+    # Get reaction data for all posts in two queries instead of three per post
+    post_ids = [post['id'] for post in posts]
+    heart_counts = get_reaction_counts_for_posts(post_ids, user['id'] if user else None, 'heart')
     reactions_by_post = {}
     user_reactions = {}
     heart_users_by_post = {}
-    for post in posts:
-        # Get heart count for this post
-        heart_count = db.execute('''
-            SELECT COUNT(*) as count 
-            FROM reactions 
-            WHERE post_id = ? AND reaction_type = ?
-        ''', (post['id'], 'heart')).fetchone()['count']
-        reactions_by_post[post['id']] = heart_count
-        
-        # Get list of users who liked this post
-        heart_users = db.execute('''
-            SELECT u.name 
+    for post_id in post_ids:
+        reactions_by_post[post_id], user_reactions[post_id] = heart_counts.get(post_id, (0, False))
+        heart_users_by_post[post_id] = []
+    
+    # Get list of users who liked each post
+    if post_ids:
+        placeholders = ','.join('?' * len(post_ids))
+        heart_users = db.execute(f'''
+            SELECT r.post_id, u.name 
             FROM reactions r 
             JOIN users u ON r.user_id = u.id 
-            WHERE r.post_id = ? AND r.reaction_type = ? 
+            WHERE r.reaction_type = ? AND r.post_id IN ({placeholders}) 
             ORDER BY r.created DESC
-        ''', (post['id'], 'heart')).fetchall()
-        heart_users_by_post[post['id']] = [row['name'] for row in heart_users]
-        
-        # Check if current user has hearted this post
-        if user:
-            user_heart = db.execute('''
-                SELECT id FROM reactions 
-                WHERE post_id = ? AND user_id = ? AND reaction_type = ?
-            ''', (post['id'], user['id'], 'heart')).fetchone()
-            user_reactions[post['id']] = bool(user_heart)
-        else:
-            user_reactions[post['id']] = False
+        ''', ('heart', *post_ids)).fetchall()
+        for row in heart_users:
+            heart_users_by_post[row['post_id']].append(row['name'])
     
     # Get filter tags for the sidebar
     filter_tags = db.execute('SELECT * FROM filter_tags ORDER BY name').fetchall()
@@ -372,9 +393,7 @@ def add_comment(magic_token):
                 abort(403)
     
     # Add the comment
-    db.execute('INSERT INTO comments (post_id, user_id, content, parent_comment_id) VALUES (?, ?, ?, ?)',
-               (post_id, user['id'], content, parent_comment_id))
-    db.commit()
+    create_comment(post_id, user['id'], content, parent_comment_id)
     
     # Log comment activity
     post = db.execute('SELECT title FROM posts WHERE id = ?', (post_id,)).fetchone()
@@ -422,13 +441,10 @@ def delete_post(magic_token, post_id):
     # Delete the post and related data
     post = db.execute('SELECT * FROM posts WHERE id = ?', (post_id,)).fetchone()
     if post:
-        # Delete comments and reactions associated with the post
-        db.execute('DELETE FROM comments WHERE post_id = ?', (post_id,))
-        db.execute('DELETE FROM reactions WHERE post_id = ?', (post_id,))
-        
-        # Delete the post
-        db.execute('DELETE FROM posts WHERE id = ?', (post_id,))
-        db.commit()
+        # Delete the post; trg_posts_delete removes its comments, reactions,
+        # images and tags
+        with get_write_db() as db:
+            db.execute('DELETE FROM posts WHERE id = ?', (post_id,))
     else:
         flash('Post not found!', 'danger')
     
@@ -458,32 +474,31 @@ def toggle_heart(magic_token):
         if not post:
             return jsonify({'error': 'Post not found'}), 404
         
-        # Check if user already hearted this post
-        existing_reaction = db.execute(
-            'SELECT * FROM reactions WHERE user_id = ? AND post_id = ? AND reaction_type = ?',
-            (user['id'], post_id, 'heart')
-        ).fetchone()
-        
-        if existing_reaction:
-            # Remove heart
-            db.execute(
-                'DELETE FROM reactions WHERE user_id = ? AND post_id = ? AND reaction_type = ?',
+        with get_write_db() as db:
+            # Check if user already hearted this post
+            existing_reaction = db.execute(
+                'SELECT * FROM reactions WHERE user_id = ? AND post_id = ? AND reaction_type = ?',
                 (user['id'], post_id, 'heart')
-            )
-            hearted = False
-            # Log unlike activity
-            log_activity('unlike', user['id'], user['name'], post_id, post['title'])
-        else:
-            # Add heart with Pacific Time
-            db.execute(
-                'INSERT INTO reactions (user_id, post_id, reaction_type, created) VALUES (?, ?, ?, ?)',
-                (user['id'], post_id, 'heart', get_pacific_now())
-            )
-            hearted = True
-            # Log like activity
-            log_activity('like', user['id'], user['name'], post_id, post['title'])
-        
-        db.commit()
+            ).fetchone()
+            
+            if existing_reaction:
+                # Remove heart
+                db.execute(
+                    'DELETE FROM reactions WHERE user_id = ? AND post_id = ? AND reaction_type = ?',
+                    (user['id'], post_id, 'heart')
+                )
+                hearted = False
+                # Log unlike activity
+                log_activity('unlike', user['id'], user['name'], post_id, post['title'])
+            else:
+                # Add heart with Pacific Time
+                db.execute(
+                    'INSERT INTO reactions (user_id, post_id, reaction_type, created) VALUES (?, ?, ?, ?)',
+                    (user['id'], post_id, 'heart', get_pacific_now())
+                )
+                hearted = True
+                # Log like activity
+                log_activity('like', user['id'], user['name'], post_id, post['title'])
         
         # Get updated count
         count = db.execute(
@@ -523,16 +538,16 @@ def user_settings(magic_token):
             print(f"Error accessing user_notification_preferences table: {table_error}")
             # Table might not exist, create it
             try:
-                db.execute('''CREATE TABLE IF NOT EXISTS user_notification_preferences (
-                    user_id INTEGER PRIMARY KEY,
-                    account_created INTEGER DEFAULT 1,
-                    new_post INTEGER DEFAULT 1,
-                    major_event INTEGER DEFAULT 1,
-                    comment_reply INTEGER DEFAULT 1,
-                    updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )''')
-                db.commit()
+                with get_write_db() as db:
+                    db.execute('''CREATE TABLE IF NOT EXISTS user_notification_preferences (
+                        user_id INTEGER PRIMARY KEY,
+                        account_created INTEGER DEFAULT 1,
+                        new_post INTEGER DEFAULT 1,
+                        major_event INTEGER DEFAULT 1,
+                        comment_reply INTEGER DEFAULT 1,
+                        updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (user_id) REFERENCES users (id)
+                    )''')
                 print("Created user_notification_preferences table")
                 prefs = None
             except Exception as create_error:
@@ -542,12 +557,7 @@ def user_settings(magic_token):
         # If no preferences exist, create defaults
         if not prefs:
             print("Creating default preferences for user")
-            db.execute('''INSERT INTO user_notification_preferences 
-                         (user_id, account_created, new_post, major_event, comment_reply)
-                         VALUES (?, 1, 1, 1, 1)''', (user['id'],))
-            db.commit()
-            prefs = db.execute('SELECT * FROM user_notification_preferences WHERE user_id = ?', 
-                              (user['id'],)).fetchone()
+            prefs = create_default_user_notification_preferences(user['id'])
             print("Default preferences created")
         
         print("Rendering user_settings.html template")
@@ -587,11 +597,7 @@ def update_user_settings(magic_token):
             major_event = 1 if request.form.get('major_event') else 0
         
         # Update preferences
-        db.execute('''UPDATE user_notification_preferences 
-                     SET new_post = ?, major_event = ?, comment_reply = ?
-                     WHERE user_id = ?''',
-                   (new_post, major_event, comment_reply, user['id']))
-        db.commit()
+        update_user_notification_preferences(user['id'], new_post, major_event, comment_reply)
         
         flash('Your email preferences have been updated successfully!', 'success')
         return redirect(url_for('main.user_settings', magic_token=magic_token))
@@ -612,8 +618,8 @@ def photo_stream(magic_token, sort_order='recent', offset=0):
         abort(403)
     
     # Update last login time
-    db.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user['id'],))
-    db.commit()
+    with get_write_db() as db:
+        db.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user['id'],))
     
     # Get individual images from the images table
     limit = 50
@@ -654,20 +660,11 @@ def photo_stream(magic_token, sort_order='recent', offset=0):
 def about_us():
     """Display the About Us page"""
     try:
-        # Get the about us content from database
-        conn = sqlite3.connect('familybook.db')
-        cursor = conn.cursor()
-        
-        # Create table if it doesn't exist
-        cursor.execute('''CREATE TABLE IF NOT EXISTS about_us 
-                         (id INTEGER PRIMARY KEY, content TEXT, updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        
-        # Get the latest content
-        cursor.execute('SELECT content FROM about_us ORDER BY id DESC LIMIT 1')
-        result = cursor.fetchone()
-        conn.close()
+        # Get the latest about us content from database
+        db = get_db()
+        result = db.execute('SELECT content FROM about_us ORDER BY id DESC LIMIT 1').fetchone()
         
-        content = result[0] if result else '<h2>Welcome to Our Family</h2><p>Share your family story here...</p>'
+        content = result['content'] if result else '<h2>Welcome to Our Family</h2><p>Share your family story here...</p>'
         
         return render_template('about_us.html', content=content)
     except Exception as e:
@@ -732,11 +729,15 @@ def create_picker_session_endpoint():
 def poll_picker_session_endpoint(session_id):
     """Poll a Google Photos Picker session for completion"""
     try:
-        from google_photos import poll_picker_session, get_picked_media_items
+        from google_photos import poll_picker_session, get_picked_media_items, picker_poll_interval
         
         # Use the updated poll_picker_session function
         session = poll_picker_session(session_id)
         
+        # How long the client should wait before polling again; grows with each
+        # unanswered poll (the client sends how many it has made so far)
+        next_poll = picker_poll_interval(session, request.args.get('attempt', 0, type=int))
+        
         # Check if media items have been selected
         media_items_picked = session.get('mediaItemsSet', False)
         
@@ -750,7 +751,8 @@ def poll_picker_session_endpoint(session_id):
                     return jsonify({
                         'success': True,
                         'completed': False,
-                        'state': 'PICKING_IN_PROGRESS'
+                        'state': 'PICKING_IN_PROGRESS',
+                        'nextPollSeconds': next_poll
                     })
                 
                 # Extract the picked media items
@@ -775,7 +777,8 @@ def poll_picker_session_endpoint(session_id):
             return jsonify({
                 'success': True,
                 'completed': False,
-                'state': 'PICKING_IN_PROGRESS'
+                'state': 'PICKING_IN_PROGRESS',
+                'nextPollSeconds': next_poll
             })
             
     except Exception as e:
@@ -844,38 +847,7 @@ def google_photos_callback():
 @main_bp.route('/test-polling')
 def test_polling():
     """Test page for Google Photos polling"""
-    return '''
-    <!DOCTYPE html>
-    <html><head><title>Test Polling</title></head><body>
-    <h1>Test Google Photos Polling</h1>
-    <button onclick="testPolling()">Test Poll Session</button>
-    <div id="results"></div>
-    <script>
-        async function testPolling() {
-            const sessionId = 'e94bd304-1ab4-440f-a4bc-54094baae781';
-            try {
-                console.log('Testing polling...');
-                const response = await fetch(`/api/google-photos/poll-session/${sessionId}`);
-                const pollData = await response.json();
-                console.log('Poll response:', pollData);
-                document.getElementById('results').innerHTML = '<pre>' + JSON.stringify(pollData, null, 2) + '</pre>';
-                
-                if (pollData.selectedItems && pollData.selectedItems.length > 0) {
-                    console.log('Testing download...');
-                    const downloadResponse = await fetch('/api/google-photos/download-selected', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ selectedItems: pollData.selectedItems })
-                    });
-                    const downloadData = await downloadResponse.json();
-                    console.log('Download response:', downloadData);
-                    document.getElementById('results').innerHTML += '<h3>Download:</h3><pre>' + JSON.stringify(downloadData, null, 2) + '</pre>';
-                }
-            } catch (error) {
-                console.error('Error:', error);
-                document.getElementById('results').innerHTML = 'Error: ' + error.message;
-            }
-        }
-    </script>
-    </body></html>
-    '''
\ No newline at end of file
+    resp = make_response(_TEST_POLLING_HTML)
+    resp.headers['Cache-Control'] = 'public, max-age=3600'
+    resp.set_etag('test-poll-v1')
+    return resp.make_conditional(request)
\ No newline at end of file
@@ -10,6 +10,9 @@ This script will:
 
 import sys
 import os
+import atexit
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 
 # Add the app directory to the Python path
 sys.path.insert(0, os.path.dirname(__file__))
@@ -17,6 +20,26 @@ sys.path.insert(0, os.path.dirname(__file__))
 from app import app
 from db.database import get_db
 
+# Single background writer so the --execute summary isn't held up by the commit
+_write_executor = ThreadPoolExecutor(max_workers=1)
+atexit.register(_write_executor.shutdown, wait=True)
+
+def _apply(db_path, ops):
+    """Apply queued (sql, params) changes in one transaction on a dedicated connection"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for sql, params in ops:
+                conn.execute(sql, params)
+    finally:
+        conn.close()
+
+def _flush(out):
+    """Write the buffered report lines to stdout in one go and clear the buffer"""
+    if out:
+        sys.stdout.write('\n'.join(out) + '\n')
+        out.clear()
+
 def analyze_template_usage():
     """Analyze which templates are used in code vs database"""
     
@@ -38,90 +61,93 @@ def analyze_template_usage():
 
 def cleanup_templates(dry_run=True):
     """Clean up email templates"""
+    out = []  # report lines, written to stdout in one go
     with app.app_context():
-        db = get_db()
+        try:
+            db = get_db()
         
-        # Get all templates from database
-        templates = db.execute('SELECT * FROM email_templates ORDER BY template_name').fetchall()
+            # Get all templates from database (template_name is UNIQUE, so its
+            # index already serves the ORDER BY; skip the large body columns)
+            templates = db.execute('SELECT id, template_name, is_active FROM email_templates ORDER BY template_name').fetchall()
         
-        print(f"Found {len(templates)} email templates in database:\n")
+            out.append(f"Found {len(templates)} email templates in database:\n")
         
-        used_templates, unused_templates = analyze_template_usage()
+            used_templates, unused_templates = analyze_template_usage()
         
-        for template in templates:
-            template_name = template['template_name']
-            is_active = bool(template['is_active'])
+            for template in templates:
+                template_name = template['template_name']
+                is_active = bool(template['is_active'])
             
-            status = "ACTIVE" if is_active else "INACTIVE"
+                status = "ACTIVE" if is_active else "INACTIVE"
             
-            if template_name in used_templates:
-                print(f"✓ KEEP   {template_name:<20} ({status}) - Used in code")
-            elif template_name in unused_templates:
-                print(f"✗ REMOVE {template_name:<20} ({status}) - Unused template definition")
-            else:
-                print(f"? CHECK  {template_name:<20} ({status}) - Unknown template")
+                if template_name in used_templates:
+                    out.append(f"✓ KEEP   {template_name:<20} ({status}) - Used in code")
+                elif template_name in unused_templates:
+                    out.append(f"✗ REMOVE {template_name:<20} ({status}) - Unused template definition")
+                else:
+                    out.append(f"? CHECK  {template_name:<20} ({status}) - Unknown template")
         
-        print("\n" + "="*60 + "\n")
+            out.append("\n" + "="*60 + "\n")
         
-        # Handle new_post vs new_post_notification conflict
-        new_post = None
-        new_post_notification = None
+            # Handle new_post vs new_post_notification conflict
+            new_post = None
+            new_post_notification = None
         
-        for template in templates:
-            if template['template_name'] == 'new_post':
-                new_post = template
-            elif template['template_name'] == 'new_post_notification':
-                new_post_notification = template
+            for template in templates:
+                if template['template_name'] == 'new_post':
+                    new_post = template
+                elif template['template_name'] == 'new_post_notification':
+                    new_post_notification = template
         
-        if new_post and new_post_notification:
-            print("CONFLICT DETECTED: Both 'new_post' and 'new_post_notification' exist")
-            print(f"  new_post:              Active={bool(new_post['is_active'])}")
-            print(f"  new_post_notification: Active={bool(new_post_notification['is_active'])}")
-            print("\nRecommendation: Keep the active one, remove the other")
+            if new_post and new_post_notification:
+                out.append("CONFLICT DETECTED: Both 'new_post' and 'new_post_notification' exist")
+                out.append(f"  new_post:              Active={bool(new_post['is_active'])}")
+                out.append(f"  new_post_notification: Active={bool(new_post_notification['is_active'])}")
+                out.append("\nRecommendation: Keep the active one, remove the other")
             
-        elif new_post_notification and not new_post:
-            print("NAMING ISSUE: 'new_post_notification' exists but code expects 'new_post'")
-            print("Recommendation: Rename 'new_post_notification' to 'new_post'")
+            elif new_post_notification and not new_post:
+                out.append("NAMING ISSUE: 'new_post_notification' exists but code expects 'new_post'")
+                out.append("Recommendation: Rename 'new_post_notification' to 'new_post'")
             
-        elif new_post and not new_post_notification:
-            print("✓ GOOD: 'new_post' exists and matches code expectations")
+            elif new_post and not new_post_notification:
+                out.append("✓ GOOD: 'new_post' exists and matches code expectations")
         
-        # Removal candidates
-        removal_candidates = []
-        for template in templates:
-            if template['template_name'] in unused_templates:
-                removal_candidates.append(template)
+            # Removal candidates
+            removal_candidates = []
+            for template in templates:
+                if template['template_name'] in unused_templates:
+                    removal_candidates.append(template)
         
-        if removal_candidates:
-            print(f"\nTemplates to remove ({len(removal_candidates)}):")
-            for template in removal_candidates:
-                print(f"  - {template['template_name']} (ID: {template['id']})")
+            if removal_candidates:
+                out.append(f"\nTemplates to remove ({len(removal_candidates)}):")
+                for template in removal_candidates:
+                    out.append(f"  - {template['template_name']} (ID: {template['id']})")
         
-        if dry_run:
-            print("\n=== DRY RUN MODE ===")
-            print("No changes will be made. Run with --execute to apply changes.")
-        else:
-            print("\n=== APPLYING CHANGES ===")
+            if dry_run:
+                out.append("\n=== DRY RUN MODE ===")
+                out.append("No changes will be made. Run with --execute to apply changes.")
+            else:
+                out.append("\n=== APPLYING CHANGES ===")
             
-            # Remove unused templates
-            for template in removal_candidates:
-                try:
-                    db.execute('DELETE FROM email_templates WHERE id = ?', (template['id'],))
-                    print(f"✓ Removed template: {template['template_name']}")
-                except Exception as e:
-                    print(f"✗ Failed to remove {template['template_name']}: {e}")
+                ops = []
             
-            # Handle new_post_notification rename if needed
-            if new_post_notification and not new_post:
-                try:
-                    db.execute("UPDATE email_templates SET template_name = 'new_post' WHERE id = ?", 
-                             (new_post_notification['id'],))
-                    print(f"✓ Renamed 'new_post_notification' to 'new_post'")
-                except Exception as e:
-                    print(f"✗ Failed to rename template: {e}")
+                # Remove unused templates
+                for template in removal_candidates:
+                    ops.append(('DELETE FROM email_templates WHERE id = ?', (template['id'],)))
+                    out.append(f"✓ Removing template: {template['template_name']}")
             
-            db.commit()
-            print("\n✓ Email template cleanup completed!")
+                # Handle new_post_notification rename if needed
+                if new_post_notification and not new_post:
+                    ops.append(("UPDATE email_templates SET template_name = 'new_post' WHERE id = ?",
+                                (new_post_notification['id'],)))
+                    out.append(f"✓ Renaming 'new_post_notification' to 'new_post'")
+            
+                # Report first, so it never lands after the worker's status line
+                _flush(out)
+                # Written in the background; the executor is joined at exit
+                return _write_executor.submit(_apply, app.config['DATABASE'], ops)
+        finally:
+            _flush(out)
 
 if __name__ == "__main__":
     import argparse
@@ -129,4 +155,11 @@ if __name__ == "__main__":
     parser.add_argument('--execute', action='store_true', help='Actually remove templates (without this flag, runs in dry-run mode)')
     args = parser.parse_args()
     
-    cleanup_templates(dry_run=not args.execute)
\ No newline at end of file
+    future = cleanup_templates(dry_run=not args.execute)
+    if future is not None:
+        # Wait for the background write so the status is the last line printed
+        try:
+            future.result()
+            print("\n✓ Email template cleanup completed!")
+        except Exception as e:
+            print(f"✗ Failed to apply template changes (nothing was changed): {e}")
\ No newline at end of file
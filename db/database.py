@@ -2,179 +2,488 @@
 Database connection management and initialization functions.
 
 This module handles:
-- Database connection management (get_db, close_db)
+- Database connection management (init_app, get_db, close_db)
 - Database initialization (init_db)
 - OAuth initialization (init_oauth_on_import)
 """
 
+import atexit
+import contextlib
 import os
+import queue
 import sqlite3
+import threading
+import time
+from authlib.common.errors import AuthlibBaseError
 from flask import g, current_app
 
+from services.media_service import extract_images_from_posts
+from .default_templates import DEFAULT_EMAIL_TEMPLATES
+
+# Pooled connections, one bounded pool per database path. Size it to the
+# number of worker threads (e.g. gunicorn --threads).
+POOL_SIZE = int(os.environ.get('FAMILYBOOK_DB_POOL_SIZE', '8'))
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Database path, set once by init_app() so get_db() skips the config lookup
+_db_path = None
+
+# Bump whenever init_db gains a new CREATE/ALTER/seed step so existing
+# databases run the migration once more
+SCHEMA_VERSION = 8
+
+# Serializes write transactions opened through get_write_db() within this
+# process, so helpers queue on a lock instead of spinning on SQLITE_BUSY
+_write_lock = threading.RLock()
+
+# Background writer for fire-and-forget inserts (activity log). Rows are
+# batched per statement and committed together every WRITE_BATCH_SIZE rows
+# or WRITE_BATCH_MS milliseconds, whichever comes first.
+WRITE_BATCH_SIZE = 500
+WRITE_BATCH_MS = 200
+_write_queue = queue.Queue(maxsize=10000)
+_writer_thread = None
+_writer_lock = threading.Lock()
+
+# Set once the Google OAuth client is registered, so repeat calls skip the settings lookup
+_oauth_registered = False
+
+
+def _get_pool(path):
+    """Return the connection pool for a database path, creating it on first use."""
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, queue.LifoQueue(maxsize=POOL_SIZE))
+    return pool
+
+
+def _connect(path):
+    """Open a new connection configured for pooled use."""
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    # Per-connection tuning, applied once when the connection is opened
+    conn.executescript(
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA temp_store=MEMORY;'
+        'PRAGMA cache_size=-65536;'
+        'PRAGMA mmap_size=268435456;'
+    )
+    return conn
+
+
+def init_app(app):
+    """Bind database handling to the app: cache the DB path and register teardown."""
+    global _db_path
+    _db_path = app.config['DATABASE']
+    app.teardown_appcontext(close_db)
+
 
 def get_db():
-    """Get database connection from Flask's application context."""
+    """Get a pooled database connection for the current application context."""
     if 'db' not in g:
-        g.db = sqlite3.connect(current_app.config['DATABASE'])
-        g.db.row_factory = sqlite3.Row
+        path = _db_path or current_app.config['DATABASE']
+        try:
+            g.db = _get_pool(path).get_nowait()
+        except queue.Empty:
+            g.db = _connect(path)
+        g.db_path = path
     return g.db
 
 
 def close_db(exception):
-    """Close database connection."""
-    db = g.pop('db', None)
-    if db is not None:
+    """Return the database connection to its pool."""
+    # Most teardowns (static files, redirects) never checked a connection out
+    if 'db' not in g:
+        return
+    db = g.pop('db')
+    path = g.pop('db_path')
+
+    # Never hand out a connection with a half-finished transaction
+    if db.in_transaction:
+        db.rollback()
+    try:
+        _get_pool(path).put_nowait(db)
+    except queue.Full:
         db.close()
 
 
+@contextlib.contextmanager
+def get_write_db():
+    """Yield the context's connection inside a serialized write transaction.
+
+    The outermost block takes the process write lock, opens BEGIN IMMEDIATE
+    (unless the caller already has a transaction open) and commits on exit,
+    or rolls back on error. Nested blocks join the outer transaction.
+    """
+    db = get_db()
+    depth = g.get('_write_depth', 0)
+    with _write_lock:
+        if depth == 0 and not db.in_transaction:
+            db.execute('BEGIN IMMEDIATE')
+        g._write_depth = depth + 1
+        try:
+            yield db
+            if depth == 0:
+                db.commit()
+        except Exception:
+            if depth == 0:
+                db.rollback()
+            raise
+        finally:
+            g._write_depth = depth
+
+
+def _drain(q, max_items, max_wait_ms):
+    """Block for one item, then collect more until max_items or max_wait_ms."""
+    batch = [q.get()]
+    deadline = time.monotonic() + max_wait_ms / 1000.0
+    while len(batch) < max_items:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(q.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _write_batch(conn, batch, logger):
+    """Insert a batch of (sql, params) items, one executemany per statement."""
+    grouped = {}
+    for sql, params in batch:
+        grouped.setdefault(sql, []).append(params)
+    try:
+        for sql, rows in grouped.items():
+            conn.executemany(sql, rows)
+        conn.commit()
+        return
+    except Exception as e:
+        conn.rollback()
+        logger.warning("Batch write of %d queued rows failed (%s), retrying one at a time", len(batch), e)
+
+    # One bad row (or a lock timeout) shouldn't lose the rest of the batch
+    for sql, params in batch:
+        try:
+            conn.execute(sql, params)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error("Dropping queued row after write failure: %s (params=%r)", e, params)
+
+
+def _writer_loop(path, logger):
+    """Own a dedicated connection and flush queued writes in batches."""
+    conn = _connect(path)
+    stop = False
+    while not stop:
+        batch = _drain(_write_queue, WRITE_BATCH_SIZE, WRITE_BATCH_MS)
+        if None in batch:
+            stop = True
+            batch = [item for item in batch if item is not None]
+        if batch:
+            _write_batch(conn, batch, logger)
+        for _ in range(len(batch) + stop):
+            _write_queue.task_done()
+    conn.close()
+
+
+def _stop_writer():
+    """Flush pending writes and stop the writer thread at interpreter exit."""
+    if _writer_thread is not None and _writer_thread.is_alive():
+        _write_queue.put(None)
+        _writer_thread.join(timeout=5)
+
+
+def queue_write(sql, params):
+    """Queue an INSERT for the background writer instead of committing inline."""
+    global _writer_thread
+    if _writer_thread is None:
+        path = _db_path or current_app.config['DATABASE']
+        with _writer_lock:
+            if _writer_thread is None:
+                # The writer has no app context, so hand it the app's logger
+                thread = threading.Thread(target=_writer_loop, args=(path, current_app.logger),
+                                          name='db-writer', daemon=True)
+                thread.start()
+                atexit.register(_stop_writer)
+                _writer_thread = thread
+    _write_queue.put_nowait((sql, params))
+
+
+# Tables and indexes created by init_db, run as one script. Columns added
+# to existing tables later are handled separately with ensure_column().
+_SCHEMA_DDL = """
+-- Create posts table
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    image_filename TEXT,
+    video_filename TEXT,
+    author_id INTEGER,
+    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (author_id) REFERENCES users (id)
+);
+
+-- Add users table with admin flag
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    magic_token TEXT UNIQUE NOT NULL,
+    is_admin INTEGER DEFAULT 0,
+    last_login TIMESTAMP,
+    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Add comments table
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    parent_comment_id INTEGER,
+    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (post_id) REFERENCES posts (id),
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    FOREIGN KEY (parent_comment_id) REFERENCES comments (id)
+);
+
+-- Add reactions table for hearts
+CREATE TABLE IF NOT EXISTS reactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    reaction_type TEXT NOT NULL DEFAULT 'heart',
+    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (post_id) REFERENCES posts (id),
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    UNIQUE(post_id, user_id, reaction_type)
+);
+
+-- Add images table for extracted images
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    url TEXT NOT NULL,
+    upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    extracted_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (post_id) REFERENCES posts (id)
+);
+
+-- Add settings table for SMTP configuration
+CREATE TABLE IF NOT EXISTS settings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE NOT NULL,
+    value TEXT,
+    description TEXT,
+    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Add email templates table
+CREATE TABLE IF NOT EXISTS email_templates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    template_name TEXT UNIQUE NOT NULL,
+    display_name TEXT NOT NULL,
+    description TEXT,
+    subject_template TEXT NOT NULL,
+    html_template TEXT NOT NULL,
+    plain_template TEXT NOT NULL,
+    variables TEXT,
+    is_active INTEGER DEFAULT 1,
+    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Add user notification preferences table for granular control
+CREATE TABLE IF NOT EXISTS user_notification_preferences (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    account_created INTEGER DEFAULT 1,
+    new_post INTEGER DEFAULT 1,
+    major_event INTEGER DEFAULT 1,
+    comment_reply INTEGER DEFAULT 1,
+    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    UNIQUE(user_id)
+);
+
+-- Create filter tags table
+CREATE TABLE IF NOT EXISTS filter_tags (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL,
+    display_name TEXT NOT NULL,
+    color TEXT NOT NULL DEFAULT '#007bff',
+    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create activity log table for audit trail
+CREATE TABLE IF NOT EXISTS activity_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    user_name TEXT,
+    action_type TEXT NOT NULL,
+    post_id INTEGER,
+    post_title TEXT,
+    comment_text TEXT,
+    ip_address TEXT,
+    user_agent TEXT,
+    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    FOREIGN KEY (post_id) REFERENCES posts (id)
+);
+
+-- Create email logs table for tracking sent emails
+CREATE TABLE IF NOT EXISTS email_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient_email TEXT NOT NULL,
+    template_name TEXT,
+    subject TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    error_message TEXT,
+    user_id INTEGER,
+    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+-- Content for the About Us page; the latest row is the current version
+CREATE TABLE IF NOT EXISTS about_us (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    content TEXT NOT NULL,
+    updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One row per tag on a post, so tag filters are an index lookup instead of
+-- LIKE scans over the comma-separated posts.tags column
+CREATE TABLE IF NOT EXISTS post_tags (
+    post_id INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (tag, post_id)
+);
+
+-- Deleting a post removes its dependent rows in the same statement. A
+-- trigger is used rather than ON DELETE CASCADE since existing tables
+-- would need rebuilding and foreign key enforcement is not enabled.
+CREATE TRIGGER IF NOT EXISTS trg_posts_delete AFTER DELETE ON posts
+BEGIN
+    DELETE FROM images WHERE post_id = OLD.id;
+    DELETE FROM comments WHERE post_id = OLD.id;
+    DELETE FROM reactions WHERE post_id = OLD.id;
+    DELETE FROM post_tags WHERE post_id = OLD.id;
+END;
+
+-- Indexes for the lookups done on every page view. reactions(post_id) and
+-- user_notification_preferences(user_id) are already covered by their UNIQUE keys.
+CREATE INDEX IF NOT EXISTS idx_comments_post ON comments(post_id);
+CREATE INDEX IF NOT EXISTS idx_images_post ON images(post_id);
+-- Image listings page through images ordered by extraction/upload date
+CREATE INDEX IF NOT EXISTS idx_images_extracted_date ON images(extracted_date);
+CREATE INDEX IF NOT EXISTS idx_images_upload_date ON images(upload_date);
+CREATE INDEX IF NOT EXISTS idx_activity_user ON activity_log(user_id);
+CREATE INDEX IF NOT EXISTS idx_activity_created ON activity_log(created DESC);
+CREATE INDEX IF NOT EXISTS idx_email_logs_user ON email_logs(user_id);
+CREATE INDEX IF NOT EXISTS idx_email_logs_status ON email_logs(status);
+CREATE INDEX IF NOT EXISTS idx_posts_created ON posts(created DESC);
+-- Month filter and month list match on substr(created, 1, 7) ('YYYY-MM')
+CREATE INDEX IF NOT EXISTS idx_posts_created_ym ON posts(substr(created, 1, 7), created DESC);
+"""
+
+
+def split_tags(tags):
+    """Split a comma-separated tags string into normalized tag names."""
+    if not tags:
+        return []
+    return list(dict.fromkeys(tag.strip().lower() for tag in tags.split(',') if tag.strip()))
+
+
+def ensure_column(db, table, column, decl):
+    """Add a column to a table unless it is already there."""
+    columns = {row[1] for row in db.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
+def _extract_images_if_changed(db):
+    """Re-scan posts for images only if posts changed since the last scan."""
+    # Cheap fingerprint of the posts table: new, deleted or edited posts move it
+    row = db.execute('SELECT COUNT(*), MAX(id), TOTAL(length(content)) FROM posts').fetchone()
+    watermark = ':'.join(str(value) for value in row)
+    stored = db.execute('SELECT value FROM settings WHERE key = ?',
+                        ('images_extraction_watermark',)).fetchone()
+    if stored and stored['value'] == watermark:
+        return
+
+    extract_images_from_posts()
+    db.execute('''INSERT INTO settings (key, value, description) VALUES (?, ?, ?)
+                  ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = CURRENT_TIMESTAMP''',
+               ('images_extraction_watermark', watermark, 'Posts fingerprint at the last image extraction (internal)'))
+    db.commit()
+
+
+def _run_extract_in_app_context(app):
+    """Thread target: run the image extraction check in its own app context."""
+    with app.app_context():
+        try:
+            _extract_images_if_changed(get_db())
+        except Exception as e:
+            print(f"Error extracting images from posts: {str(e)}")
+
+
+def _start_image_extraction():
+    """Scan posts for images off the startup path."""
+    # Non-daemon so short-lived callers (deploy.sh) still finish the scan before exiting
+    threading.Thread(
+        target=_run_extract_in_app_context,
+        args=(current_app._get_current_object(),),
+        name='extract-images'
+    ).start()
+
+
 def init_db():
     """Initialize database with all required tables and default data."""
-    from utils.timezone_utils import get_pacific_now
-    from services.media_service import extract_images_from_posts
-    
     with current_app.app_context():
         db = get_db()
         
-        # Create posts table
-        db.execute('''CREATE TABLE IF NOT EXISTS posts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            image_filename TEXT,
-            video_filename TEXT,
-            author_id INTEGER,
-            created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (author_id) REFERENCES users (id)
-        )''')
+        # Schema and seed data are already current; skip straight to the image scan
+        if db.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+            _start_image_extraction()
+            return
         
-        # Add author_id to existing posts table if it doesn't exist
-        try:
-            db.execute('ALTER TABLE posts ADD COLUMN author_id INTEGER')
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
+        # Run the whole migration in one transaction (one fsync instead of dozens);
+        # a failure leaves it open and it is rolled back when the connection is released.
+        # executescript() commits any pending transaction first, so the script opens it.
+        db.executescript('BEGIN;\n' + _SCHEMA_DDL)
         
-        # Add users table with admin flag
-        db.execute('''CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            magic_token TEXT UNIQUE NOT NULL,
-            is_admin INTEGER DEFAULT 0,
-            last_login TIMESTAMP,
-            created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
+        # Add author_id to existing posts table if it doesn't exist
+        ensure_column(db, 'posts', 'author_id', 'INTEGER')
         
         # Add last_login to existing users table if it doesn't exist
-        try:
-            db.execute('ALTER TABLE users ADD COLUMN last_login TIMESTAMP')
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
-        
-        # Add comments table
-        db.execute('''CREATE TABLE IF NOT EXISTS comments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            post_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            content TEXT NOT NULL,
-            parent_comment_id INTEGER,
-            created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (post_id) REFERENCES posts (id),
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (parent_comment_id) REFERENCES comments (id)
-        )''')
+        ensure_column(db, 'users', 'last_login', 'TIMESTAMP')
         
         # Add parent_comment_id to existing comments table if it doesn't exist
-        try:
-            db.execute('ALTER TABLE comments ADD COLUMN parent_comment_id INTEGER')
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
-        
-        # Add reactions table for hearts
-        db.execute('''CREATE TABLE IF NOT EXISTS reactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            post_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            reaction_type TEXT NOT NULL DEFAULT 'heart',
-            created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (post_id) REFERENCES posts (id),
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            UNIQUE(post_id, user_id, reaction_type)
-        )''')
-        
-        # Add images table for extracted images
-        db.execute('''CREATE TABLE IF NOT EXISTS images (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            post_id INTEGER NOT NULL,
-            filename TEXT NOT NULL,
-            url TEXT NOT NULL,
-            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            extracted_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (post_id) REFERENCES posts (id)
-        )''')
+        ensure_column(db, 'comments', 'parent_comment_id', 'INTEGER')
+        db.execute('CREATE INDEX IF NOT EXISTS idx_comments_parent ON comments(parent_comment_id)')
         
         # Add admin flag to existing users table if it doesn't exist
-        try:
-            db.execute('ALTER TABLE users ADD COLUMN is_admin INTEGER DEFAULT 0')
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
+        ensure_column(db, 'users', 'is_admin', 'INTEGER DEFAULT 0')
         
         # Add email notification preferences to users table
-        try:
-            db.execute('ALTER TABLE users ADD COLUMN email_notifications TEXT DEFAULT "all"')  # "all", "major", "none"
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
+        ensure_column(db, 'users', 'email_notifications', 'TEXT DEFAULT "all"')  # "all", "major", "none"
         
         # Add tags column to posts table
-        try:
-            db.execute('ALTER TABLE posts ADD COLUMN tags TEXT')  # JSON string for multiple tags
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
-        
-        # Add settings table for SMTP configuration
-        db.execute('''CREATE TABLE IF NOT EXISTS settings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            key TEXT UNIQUE NOT NULL,
-            value TEXT,
-            description TEXT,
-            created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        # Add email templates table
-        db.execute('''CREATE TABLE IF NOT EXISTS email_templates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            template_name TEXT UNIQUE NOT NULL,
-            display_name TEXT NOT NULL,
-            description TEXT,
-            subject_template TEXT NOT NULL,
-            html_template TEXT NOT NULL,
-            plain_template TEXT NOT NULL,
-            variables TEXT,
-            is_active INTEGER DEFAULT 1,
-            created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
+        ensure_column(db, 'posts', 'tags', 'TEXT')  # JSON string for multiple tags
         
-        # Add user notification preferences table for granular control
-        db.execute('''CREATE TABLE IF NOT EXISTS user_notification_preferences (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            account_created INTEGER DEFAULT 1,
-            new_post INTEGER DEFAULT 1,
-            major_event INTEGER DEFAULT 1,
-            comment_reply INTEGER DEFAULT 1,
-            magic_link_reminder INTEGER DEFAULT 1,
-            created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            UNIQUE(user_id)
-        )''')
+        # Backfill post_tags from the tags column of existing posts
+        tagged_posts = db.execute("SELECT id, tags FROM posts WHERE tags IS NOT NULL AND tags != ''").fetchall()
+        db.executemany('INSERT OR IGNORE INTO post_tags (post_id, tag) VALUES (?, ?)',
+                       [(post['id'], tag) for post in tagged_posts for tag in split_tags(post['tags'])])
         
         # Insert default SMTP settings if they don't exist
         default_settings = [
@@ -192,130 +501,15 @@ def init_db():
             ('oauth_redirect_uri', '', 'OAuth redirect URI (e.g., http://localhost:5000/admin/oauth/callback)')
         ]
         
-        for key, default_value, description in default_settings:
-            existing = db.execute('SELECT id FROM settings WHERE key = ?', (key,)).fetchone()
-            if not existing:
-                db.execute('INSERT INTO settings (key, value, description) VALUES (?, ?, ?)',
-                          (key, default_value, description))
+        # settings.key is UNIQUE, so existing rows are left untouched
+        db.executemany('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)',
+                       default_settings)
         
         # Insert default email templates if they don't exist
-        default_templates = [
-            ('account_created', 'Welcome to Familybook', 'Welcome email sent when a new user account is created',
-             'Welcome to {{family_name}} Familybook!',
-             '''<html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center; color: white;">
-                    <h1 style="margin: 0;">🏠 {{family_name}} Familybook</h1>
-                    <p style="margin: 5px 0 0 0;">Welcome to the Family!</p>
-                </div>
-                <div style="padding: 20px; background: #f9f9f9;">
-                    <h2 style="color: #333; margin-top: 0;">Hi {{user_name}}!</h2>
-                    <p style="color: #666; line-height: 1.6;">You've been invited to join the {{family_name}} family photo book! This is a private space where we share memories, photos, and stay connected.</p>
-                    <div style="text-align: center; margin: 30px 0;">
-                        <a href="{{magic_link}}" style="background: #667eea; color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; font-weight: bold; display: inline-block;">📖 Enter Familybook</a>
-                    </div>
-                    <div style="background: white; padding: 15px; border-left: 4px solid #667eea; margin: 20px 0; border-radius: 3px;">
-                        <p style="margin: 0; color: #333; font-size: 14px;"><strong>🔗 Your Personal Link:</strong></p>
-                        <p style="margin: 5px 0 0 0; color: #666; font-size: 14px;">{{magic_link}}</p>
-                        <p style="margin: 10px 0 0 0; color: #666; font-size: 12px; font-style: italic;">Save this link somewhere safe - it's your key to the family memories!</p>
-                    </div>
-                    <p style="color: #666; font-size: 14px;">Bookmark this link - it's your personal gateway to stay connected with the family!</p>
-                </div>
-                <div style="padding: 20px; text-align: center; background: #e9ecef; color: #666; font-size: 12px;">
-                    <p style="margin: 0;">© {{current_year}} {{family_name}} Familybook</p>
-                </div>
-            </body></html>''',
-             '''Welcome to {{family_name}} Familybook!
-
-Hi {{user_name}}!
-
-You've been invited to join the {{family_name}} family photo book! This is a private space where we share memories, photos, and stay connected.
-
-Your Personal Link: {{magic_link}}
-
-Bookmark this link - it's your personal gateway to stay connected with the family!
-
-© {{current_year}} {{family_name}} Familybook''',
-             '{"user_name": "User\'s name", "magic_link": "User\'s magic link URL", "family_name": "Family name from settings", "current_year": "Current year"}'),
-
-            ('new_post', 'New Post in Familybook', 'Notification sent when a new post is created',
-             'New post: {{post_title}}',
-             '''<html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <div style="background: linear-gradient(135deg, #28a745 0%, #20c997 100%); padding: 20px; text-align: center; color: white;">
-                    <h1 style="margin: 0;">📝 New Post in {{family_name}} Familybook</h1>
-                    <p style="margin: 5px 0 0 0;">{{post_title}}</p>
-                </div>
-                <div style="padding: 20px; background: #f9f9f9;">
-                    <p style="color: #666; line-height: 1.6;">{{author_name}} just shared a new memory in the family book!</p>
-                    <div style="background: white; padding: 15px; border-radius: 5px; margin: 20px 0; border: 1px solid #dee2e6;">
-                        <h3 style="margin: 0 0 10px 0; color: #333;">{{post_title}}</h3>
-                        <div style="color: #666; line-height: 1.6;">{{post_content}}</div>
-                    </div>
-                    <div style="text-align: center; margin: 30px 0;">
-                        <a href="{{magic_link}}" style="background: #28a745; color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; font-weight: bold; display: inline-block;">📖 Read Full Post</a>
-                    </div>
-                </div>
-                <div style="padding: 20px; text-align: center; background: #e9ecef; color: #666; font-size: 12px;">
-                    <p style="margin: 0;">© {{current_year}} {{family_name}} Familybook</p>
-                </div>
-            </body></html>''',
-             '''New post: {{post_title}}
-
-{{author_name}} just shared a new memory in the family book!
-
-{{post_title}}
-{{post_content}}
-
-Read the full post: {{magic_link}}
-
-© {{current_year}} {{family_name}} Familybook''',
-             '{"post_title": "Title of the new post", "post_content": "Post content preview", "author_name": "Name of post author", "magic_link": "User\'s magic link URL", "family_name": "Family name from settings", "current_year": "Current year"}'),
-
-            ('comment_reply', 'Someone replied to your comment', 'Notification sent when someone replies to a user\'s comment',
-             'Reply to your comment on "{{post_title}}"',
-             '''<html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <div style="background: linear-gradient(135deg, #fd7e14 0%, #e83e8c 100%); padding: 20px; text-align: center; color: white;">
-                    <h1 style="margin: 0;">💬 Reply to Your Comment</h1>
-                    <p style="margin: 5px 0 0 0;">{{family_name}} Familybook</p>
-                </div>
-                <div style="padding: 20px; background: #f9f9f9;">
-                    <p style="color: #666; line-height: 1.6;">{{reply_author}} replied to your comment on "{{post_title}}"</p>
-                    <div style="background: white; padding: 15px; border-radius: 5px; margin: 20px 0; border: 1px solid #dee2e6;">
-                        <p style="margin: 0 0 10px 0; color: #666; font-size: 14px;"><strong>Your comment:</strong></p>
-                        <div style="background: #f8f9fa; padding: 10px; border-left: 3px solid #fd7e14; margin-bottom: 15px;">{{original_comment}}</div>
-                        <p style="margin: 0 0 10px 0; color: #666; font-size: 14px;"><strong>{{reply_author}} replied:</strong></p>
-                        <div style="background: #fff3cd; padding: 10px; border-left: 3px solid #e83e8c;">{{reply_content}}</div>
-                    </div>
-                    <div style="text-align: center; margin: 30px 0;">
-                        <a href="{{magic_link}}" style="background: #fd7e14; color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; font-weight: bold; display: inline-block;">💬 View Conversation</a>
-                    </div>
-                </div>
-                <div style="padding: 20px; text-align: center; background: #e9ecef; color: #666; font-size: 12px;">
-                    <p style="margin: 0;">© {{current_year}} {{family_name}} Familybook</p>
-                </div>
-            </body></html>''',
-             '''Reply to your comment on "{{post_title}}"
-
-{{reply_author}} replied to your comment on "{{post_title}}"
-
-Your comment:
-{{original_comment}}
-
-{{reply_author}} replied:
-{{reply_content}}
-
-View the conversation: {{magic_link}}
-
-© {{current_year}} {{family_name}} Familybook''',
-             '{"post_title": "Title of the post", "reply_author": "Name of person who replied", "reply_content": "Content of the reply", "original_comment": "User\'s original comment", "magic_link": "User\'s magic link URL", "family_name": "Family name from settings", "current_year": "Current year"}')
-        ]
-        
-        for template_name, display_name, description, subject, html, plain, variables in default_templates:
-            existing = db.execute('SELECT id FROM email_templates WHERE template_name = ?', (template_name,)).fetchone()
-            if not existing:
-                db.execute('''INSERT INTO email_templates 
-                             (template_name, display_name, description, subject_template, html_template, plain_template, variables)
-                             VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                          (template_name, display_name, description, subject, html, plain, variables))
+        db.executemany('''INSERT OR IGNORE INTO email_templates 
+                          (template_name, display_name, description, subject_template, html_template, plain_template, variables)
+                          VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                       DEFAULT_EMAIL_TEMPLATES)
         
         # Insert default filter tags if they don't exist
         default_tags = [
@@ -330,53 +524,8 @@ View the conversation: {{magic_link}}
             ('updates', 'Updates', '#607D8B')
         ]
         
-        for tag_name, display_name, color in default_tags:
-            existing = db.execute('SELECT id FROM filter_tags WHERE name = ?', (tag_name,)).fetchone()
-            if not existing:
-                try:
-                    db.execute('INSERT INTO filter_tags (name, display_name, color) VALUES (?, ?, ?)',
-                              (tag_name, display_name, color))
-                except sqlite3.OperationalError:
-                    # Filter tags table doesn't exist yet, skip for now
-                    pass
-        
-        # Create activity log table for audit trail
-        db.execute('''CREATE TABLE IF NOT EXISTS activity_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            user_name TEXT,
-            action_type TEXT NOT NULL,
-            post_id INTEGER,
-            post_title TEXT,
-            comment_text TEXT,
-            ip_address TEXT,
-            user_agent TEXT,
-            created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (post_id) REFERENCES posts (id)
-        )''')
-        
-        # Create email logs table for tracking sent emails
-        db.execute('''CREATE TABLE IF NOT EXISTS email_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            recipient_email TEXT NOT NULL,
-            template_name TEXT,
-            subject TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'pending',
-            error_message TEXT,
-            user_id INTEGER,
-            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )''')
-        
-        # Create filter tags table
-        db.execute('''CREATE TABLE IF NOT EXISTS filter_tags (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            display_name TEXT NOT NULL,
-            color TEXT NOT NULL DEFAULT '#007bff',
-            created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
+        db.executemany('INSERT OR IGNORE INTO filter_tags (name, display_name, color) VALUES (?, ?, ?)',
+                       default_tags)
         
         # Migrate magic_link_reminders preference to new system (remove deprecated column)
         try:
@@ -385,65 +534,78 @@ View the conversation: {{magic_link}}
             columns = [row[1] for row in cursor.fetchall()]
             
             if 'magic_link_reminder' in columns:
-                # Remove the deprecated magic_link_reminder column
-                db.execute('''CREATE TABLE user_notification_preferences_new (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    account_created INTEGER DEFAULT 1,
-                    new_post INTEGER DEFAULT 1,
-                    major_event INTEGER DEFAULT 1,
-                    comment_reply INTEGER DEFAULT 1,
-                    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id),
-                    UNIQUE(user_id)
-                )''')
+                if sqlite3.sqlite_version_info >= (3, 35, 0):
+                    db.execute('ALTER TABLE user_notification_preferences DROP COLUMN magic_link_reminder')
+                else:
+                    # SQLite < 3.35 has no DROP COLUMN: rebuild the table without it
+                    db.execute('''CREATE TABLE user_notification_preferences_new (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER NOT NULL,
+                        account_created INTEGER DEFAULT 1,
+                        new_post INTEGER DEFAULT 1,
+                        major_event INTEGER DEFAULT 1,
+                        comment_reply INTEGER DEFAULT 1,
+                        created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (user_id) REFERENCES users (id),
+                        UNIQUE(user_id)
+                    )''')
                 
-                # Copy data without the deprecated column
-                db.execute('''INSERT INTO user_notification_preferences_new 
-                             (id, user_id, account_created, new_post, major_event, comment_reply, created, updated)
-                             SELECT id, user_id, account_created, new_post, major_event, comment_reply, created, updated
-                             FROM user_notification_preferences''')
+                    # Copy data without the deprecated column
+                    db.execute('''INSERT INTO user_notification_preferences_new 
+                                 (id, user_id, account_created, new_post, major_event, comment_reply, created, updated)
+                                 SELECT id, user_id, account_created, new_post, major_event, comment_reply, created, updated
+                                 FROM user_notification_preferences''')
                 
-                # Drop old table and rename new one
-                db.execute('DROP TABLE user_notification_preferences')
-                db.execute('ALTER TABLE user_notification_preferences_new RENAME TO user_notification_preferences')
+                    # Drop old table and rename new one
+                    db.execute('DROP TABLE user_notification_preferences')
+                    db.execute('ALTER TABLE user_notification_preferences_new RENAME TO user_notification_preferences')
         except sqlite3.OperationalError:
             # Table doesn't exist or migration already done
             pass
         
         # Remove deprecated settings
         deprecated_settings = ['welcome_emails_enabled', 'magic_link_reminders_enabled']
-        for setting_key in deprecated_settings:
-            existing = db.execute('SELECT key FROM settings WHERE key = ?', (setting_key,)).fetchone()
-            if existing:
-                db.execute('DELETE FROM settings WHERE key = ?', (setting_key,))
+        db.execute(f"DELETE FROM settings WHERE key IN ({','.join('?' * len(deprecated_settings))})",
+                   deprecated_settings)
         
-        db.commit()
+        db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        db.commit()  # ends the BEGIN above
         
         # Extract images from existing posts and populate images table
-        extract_images_from_posts()
+        _start_image_extraction()
 
 
 def init_oauth_on_import(app=None):
     """Initialize OAuth when the module is imported (for WSGI)."""
-    try:
-        if app is None:
-            app = current_app
-            
-        with app.app_context():
-            # Import here to avoid circular imports
-            from .queries import get_setting
-            
-            client_id = get_setting('oauth_client_id')
-            client_secret = get_setting('oauth_client_secret')
+    global _oauth_registered
+    if _oauth_registered:
+        return
+
+    if app is None:
+        app = current_app
+
+    with app.app_context():
+        # Read settings directly; db.queries imports this module
+        try:
+            rows = get_db().execute(
+                'SELECT key, value FROM settings WHERE key IN (?, ?)',
+                ('oauth_client_id', 'oauth_client_secret')
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # Settings table not created yet - OAuth will be set up later if needed
+            return
+        oauth_settings = {row['key']: row['value'] for row in rows}
+        client_id = oauth_settings.get('oauth_client_id')
+        client_secret = oauth_settings.get('oauth_client_secret')
+        
+        # Get oauth from app extensions
+        oauth = getattr(app, 'oauth', None)
+        if oauth is None:
+            return
             
-            # Get oauth from app extensions
-            oauth = getattr(app, 'oauth', None)
-            if oauth is None:
-                return
-                
-            if client_id and client_secret and not hasattr(oauth, 'google'):
+        if client_id and client_secret and not hasattr(oauth, 'google'):
+            try:
                 oauth.register(
                     name='google',
                     client_id=client_id,
@@ -452,6 +614,7 @@ def init_oauth_on_import(app=None):
                     server_metadata_url='https://accounts.google.com/.well-known/openid-configuration'
                 )
                 print("OAuth client registered on module import")
-    except Exception as e:
-        # Silently fail during import - OAuth will be set up later if needed
-        pass
\ No newline at end of file
+            except (AuthlibBaseError, KeyError) as e:
+                print(f"OAuth registration failed on import: {str(e)}")
+        
+        _oauth_registered = hasattr(oauth, 'google')
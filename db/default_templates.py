@@ -0,0 +1,116 @@
+"""
+Default email templates seeded by init_db.
+
+Each entry is (template_name, display_name, description, subject_template,
+html_template, plain_template, variables), in email_templates column order.
+"""
+
+DEFAULT_EMAIL_TEMPLATES = (
+    ('account_created', 'Welcome to Familybook', 'Welcome email sent when a new user account is created',
+     'Welcome to {{family_name}} Familybook!',
+     '''<html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center; color: white;">
+                    <h1 style="margin: 0;">🏠 {{family_name}} Familybook</h1>
+                    <p style="margin: 5px 0 0 0;">Welcome to the Family!</p>
+                </div>
+                <div style="padding: 20px; background: #f9f9f9;">
+                    <h2 style="color: #333; margin-top: 0;">Hi {{user_name}}!</h2>
+                    <p style="color: #666; line-height: 1.6;">You've been invited to join the {{family_name}} family photo book! This is a private space where we share memories, photos, and stay connected.</p>
+                    <div style="text-align: center; margin: 30px 0;">
+                        <a href="{{magic_link}}" style="background: #667eea; color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; font-weight: bold; display: inline-block;">📖 Enter Familybook</a>
+                    </div>
+                    <div style="background: white; padding: 15px; border-left: 4px solid #667eea; margin: 20px 0; border-radius: 3px;">
+                        <p style="margin: 0; color: #333; font-size: 14px;"><strong>🔗 Your Personal Link:</strong></p>
+                        <p style="margin: 5px 0 0 0; color: #666; font-size: 14px;">{{magic_link}}</p>
+                        <p style="margin: 10px 0 0 0; color: #666; font-size: 12px; font-style: italic;">Save this link somewhere safe - it's your key to the family memories!</p>
+                    </div>
+                    <p style="color: #666; font-size: 14px;">Bookmark this link - it's your personal gateway to stay connected with the family!</p>
+                </div>
+                <div style="padding: 20px; text-align: center; background: #e9ecef; color: #666; font-size: 12px;">
+                    <p style="margin: 0;">© {{current_year}} {{family_name}} Familybook</p>
+                </div>
+            </body></html>''',
+     '''Welcome to {{family_name}} Familybook!
+
+Hi {{user_name}}!
+
+You've been invited to join the {{family_name}} family photo book! This is a private space where we share memories, photos, and stay connected.
+
+Your Personal Link: {{magic_link}}
+
+Bookmark this link - it's your personal gateway to stay connected with the family!
+
+© {{current_year}} {{family_name}} Familybook''',
+     '{"user_name": "User\'s name", "magic_link": "User\'s magic link URL", "family_name": "Family name from settings", "current_year": "Current year"}'),
+
+    ('new_post', 'New Post in Familybook', 'Notification sent when a new post is created',
+     'New post: {{post_title}}',
+     '''<html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+                <div style="background: linear-gradient(135deg, #28a745 0%, #20c997 100%); padding: 20px; text-align: center; color: white;">
+                    <h1 style="margin: 0;">📝 New Post in {{family_name}} Familybook</h1>
+                    <p style="margin: 5px 0 0 0;">{{post_title}}</p>
+                </div>
+                <div style="padding: 20px; background: #f9f9f9;">
+                    <p style="color: #666; line-height: 1.6;">{{author_name}} just shared a new memory in the family book!</p>
+                    <div style="background: white; padding: 15px; border-radius: 5px; margin: 20px 0; border: 1px solid #dee2e6;">
+                        <h3 style="margin: 0 0 10px 0; color: #333;">{{post_title}}</h3>
+                        <div style="color: #666; line-height: 1.6;">{{post_content}}</div>
+                    </div>
+                    <div style="text-align: center; margin: 30px 0;">
+                        <a href="{{magic_link}}" style="background: #28a745; color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; font-weight: bold; display: inline-block;">📖 Read Full Post</a>
+                    </div>
+                </div>
+                <div style="padding: 20px; text-align: center; background: #e9ecef; color: #666; font-size: 12px;">
+                    <p style="margin: 0;">© {{current_year}} {{family_name}} Familybook</p>
+                </div>
+            </body></html>''',
+     '''New post: {{post_title}}
+
+{{author_name}} just shared a new memory in the family book!
+
+{{post_title}}
+{{post_content}}
+
+Read the full post: {{magic_link}}
+
+© {{current_year}} {{family_name}} Familybook''',
+     '{"post_title": "Title of the new post", "post_content": "Post content preview", "author_name": "Name of post author", "magic_link": "User\'s magic link URL", "family_name": "Family name from settings", "current_year": "Current year"}'),
+
+    ('comment_reply', 'Someone replied to your comment', 'Notification sent when someone replies to a user\'s comment',
+     'Reply to your comment on "{{post_title}}"',
+     '''<html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+                <div style="background: linear-gradient(135deg, #fd7e14 0%, #e83e8c 100%); padding: 20px; text-align: center; color: white;">
+                    <h1 style="margin: 0;">💬 Reply to Your Comment</h1>
+                    <p style="margin: 5px 0 0 0;">{{family_name}} Familybook</p>
+                </div>
+                <div style="padding: 20px; background: #f9f9f9;">
+                    <p style="color: #666; line-height: 1.6;">{{reply_author}} replied to your comment on "{{post_title}}"</p>
+                    <div style="background: white; padding: 15px; border-radius: 5px; margin: 20px 0; border: 1px solid #dee2e6;">
+                        <p style="margin: 0 0 10px 0; color: #666; font-size: 14px;"><strong>Your comment:</strong></p>
+                        <div style="background: #f8f9fa; padding: 10px; border-left: 3px solid #fd7e14; margin-bottom: 15px;">{{original_comment}}</div>
+                        <p style="margin: 0 0 10px 0; color: #666; font-size: 14px;"><strong>{{reply_author}} replied:</strong></p>
+                        <div style="background: #fff3cd; padding: 10px; border-left: 3px solid #e83e8c;">{{reply_content}}</div>
+                    </div>
+                    <div style="text-align: center; margin: 30px 0;">
+                        <a href="{{magic_link}}" style="background: #fd7e14; color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; font-weight: bold; display: inline-block;">💬 View Conversation</a>
+                    </div>
+                </div>
+                <div style="padding: 20px; text-align: center; background: #e9ecef; color: #666; font-size: 12px;">
+                    <p style="margin: 0;">© {{current_year}} {{family_name}} Familybook</p>
+                </div>
+            </body></html>''',
+     '''Reply to your comment on "{{post_title}}"
+
+{{reply_author}} replied to your comment on "{{post_title}}"
+
+Your comment:
+{{original_comment}}
+
+{{reply_author}} replied:
+{{reply_content}}
+
+View the conversation: {{magic_link}}
+
+© {{current_year}} {{family_name}} Familybook''',
+     '{"post_title": "Title of the post", "reply_author": "Name of person who replied", "reply_content": "Content of the reply", "original_comment": "User\'s original comment", "magic_link": "User\'s magic link URL", "family_name": "Family name from settings", "current_year": "Current year"}')
+)
@@ -5,55 +5,83 @@ This module contains all functions that perform SELECT, INSERT, UPDATE, DELETE
 operations on the SQLite database.
 """
 
+import queue
 import sqlite3
-from flask import request, current_app
-from .database import get_db
+from flask import g, request
+from .database import get_db, get_write_db, split_tags, queue_write
 from utils.timezone_utils import get_pacific_now
 
 
+# SQL for the hot helpers. Every pooled connection keeps its own statement
+# cache, so passing the same string object on each call reuses the compiled
+# statement instead of re-parsing it.
+_SQL_GET_ALL_SETTINGS = 'SELECT key, value FROM settings'
+_SQL_UPDATE_SETTING = 'UPDATE settings SET value = ?, updated = CURRENT_TIMESTAMP WHERE key = ?'
+_SQL_GET_USER_BY_TOKEN = 'SELECT * FROM users WHERE magic_token = ?'
+_SQL_GET_USER_BY_ID = 'SELECT * FROM users WHERE id = ?'
+_SQL_INSERT_ACTIVITY = '''INSERT INTO activity_log 
+                     (user_id, user_name, action_type, post_id, post_title, comment_text, ip_address, user_agent, created)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+# Same row, with user id/name resolved from the magic token in the INSERT itself
+_SQL_INSERT_ACTIVITY_BY_TOKEN = '''INSERT INTO activity_log 
+                     (user_id, user_name, action_type, post_id, post_title, comment_text, ip_address, user_agent, created)
+                     SELECT u.id, u.name, ?, ?, ?, ?, ?, ?, ?
+                     FROM (SELECT 1) LEFT JOIN users u ON u.magic_token = ?'''
+_SQL_INSERT_EMAIL_LOG = '''INSERT INTO email_logs 
+                     (recipient_email, template_name, subject, status, error_message, user_id, sent_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)'''
+_SQL_UPDATE_EMAIL_LOG = 'UPDATE email_logs SET status = ?, error_message = ? WHERE id = ?'
+_SQL_INSERT_DEFAULT_PREFS = '''INSERT INTO user_notification_preferences 
+                 (user_id, account_created, new_post, major_event, comment_reply)
+                 VALUES (?, 1, 1, 1, 1)'''
+_SQL_INSERT_POST = "INSERT INTO posts (title, content, author_id, tags, created) VALUES (?, ?, ?, ?, ?)"
+
+# INSERT ... RETURNING needs SQLite 3.35+
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
 # Settings Operations
 def get_setting(key, default=None):
-    """Get a setting value from the database"""
-    with current_app.app_context():
-        db = get_db()
-        result = db.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
-        return result['value'] if result else default
+    """Get a setting value, served from the per-request settings cache"""
+    if '_settings' not in g:
+        _load_settings_cache()
+    return g._settings.get(key, default)
+
+
+def _load_settings_cache():
+    """Load every setting into flask.g with a single query"""
+    db = get_db()
+    g._settings = {row['key']: row['value'] for row in db.execute(_SQL_GET_ALL_SETTINGS)}
 
 
 def update_setting(key, value):
     """Update a setting value in the database"""
-    with current_app.app_context():
-        db = get_db()
-        db.execute('UPDATE settings SET value = ?, updated = CURRENT_TIMESTAMP WHERE key = ?', (value, key))
-        db.commit()
+    with get_write_db() as db:
+        db.execute(_SQL_UPDATE_SETTING, (value, key))
+    g.pop('_settings', None)
 
 
 # Activity Logging
 def log_activity(action_type, user_id=None, user_name=None, post_id=None, post_title=None, comment_text=None):
     """Log user activity to the activity_log table"""
     try:
-        # Get user info from magic token if not provided
-        if not user_id and not user_name:
-            magic_token = request.args.get('magic_token')
-            if magic_token:
-                db = get_db()
-                user = db.execute('SELECT id, name FROM users WHERE magic_token = ?', (magic_token,)).fetchone()
-                if user:
-                    user_id = user['id']
-                    user_name = user['name']
-        
         # Get IP and user agent
         ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'Unknown'))
         user_agent = request.environ.get('HTTP_USER_AGENT', '')[:500]  # Limit length
         
-        # Insert activity log with Pacific Time
-        db = get_db()
-        db.execute('''INSERT INTO activity_log 
-                     (user_id, user_name, action_type, post_id, post_title, comment_text, ip_address, user_agent, created)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                   (user_id, user_name, action_type, post_id, post_title, comment_text, ip_address, user_agent, get_pacific_now()))
-        db.commit()
+        # Queue the activity log row (Pacific Time) for the background writer.
+        # Without user info, the writer resolves it from the magic token.
+        magic_token = None if user_id or user_name else request.args.get('magic_token')
+        if magic_token:
+            queue_write(_SQL_INSERT_ACTIVITY_BY_TOKEN,
+                        (action_type, post_id, post_title, comment_text, ip_address, user_agent, get_pacific_now(),
+                         magic_token))
+        else:
+            queue_write(_SQL_INSERT_ACTIVITY,
+                        (user_id, user_name, action_type, post_id, post_title, comment_text, ip_address, user_agent, get_pacific_now()))
         
+    except queue.Full:
+        print("Error logging activity: write queue is full, dropping entry")
     except Exception as e:
         print(f"Error logging activity: {e}")
 
@@ -62,12 +90,9 @@ def log_activity(action_type, user_id=None, user_name=None, post_id=None, post_t
 def log_email(recipient_email, template_name=None, subject=None, status='pending', error_message=None, user_id=None):
     """Log email sending attempts to the database"""
     try:
-        db = get_db()
-        cursor = db.execute('''INSERT INTO email_logs 
-                     (recipient_email, template_name, subject, status, error_message, user_id, sent_at)
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                  (recipient_email, template_name, subject, status, error_message, user_id, get_pacific_now()))
-        db.commit()
+        with get_write_db() as db:
+            cursor = db.execute(_SQL_INSERT_EMAIL_LOG,
+                      (recipient_email, template_name, subject, status, error_message, user_id, get_pacific_now()))
         return cursor.lastrowid
     except Exception as e:
         print(f"Failed to log email: {e}")
@@ -77,10 +102,8 @@ def log_email(recipient_email, template_name=None, subject=None, status='pending
 def update_email_log(log_id, status, error_message=None):
     """Update the status of an email log entry"""
     try:
-        db = get_db()
-        db.execute('UPDATE email_logs SET status = ?, error_message = ? WHERE id = ?',
-                  (status, error_message, log_id))
-        db.commit()
+        with get_write_db() as db:
+            db.execute(_SQL_UPDATE_EMAIL_LOG, (status, error_message, log_id))
         return True
     except Exception as e:
         print(f"Failed to update email log: {e}")
@@ -88,16 +111,17 @@ def update_email_log(log_id, status, error_message=None):
 
 
 # User Operations
+
 def get_user_by_magic_token(magic_token):
     """Get user by magic token"""
     db = get_db()
-    return db.execute('SELECT * FROM users WHERE magic_token = ?', (magic_token,)).fetchone()
+    return db.execute(_SQL_GET_USER_BY_TOKEN, (magic_token,)).fetchone()
 
 
 def get_user_by_id(user_id):
     """Get user by ID"""
     db = get_db()
-    return db.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+    return db.execute(_SQL_GET_USER_BY_ID, (user_id,)).fetchone()
 
 
 def get_all_users():
@@ -114,63 +138,66 @@ def get_users_with_emails():
 
 def create_user(name, email, magic_token, email_notifications='all'):
     """Create a new user and return the user ID"""
-    db = get_db()
-    cursor = db.execute('INSERT INTO users (name, email, magic_token, email_notifications) VALUES (?, ?, ?, ?)', 
-                       (name, email, magic_token, email_notifications))
-    user_id = cursor.lastrowid
-    db.commit()
+    with get_write_db() as db:
+        cursor = db.execute('INSERT INTO users (name, email, magic_token, email_notifications) VALUES (?, ?, ?, ?)', 
+                           (name, email, magic_token, email_notifications))
+        user_id = cursor.lastrowid
     return user_id
 
 
 def delete_user(user_id):
     """Delete a user by ID"""
-    db = get_db()
-    db.execute('DELETE FROM users WHERE id = ?', (user_id,))
-    db.commit()
+    with get_write_db() as db:
+        db.execute('DELETE FROM users WHERE id = ?', (user_id,))
 
 
 def toggle_user_admin(user_id):
     """Toggle user admin status and return new status"""
-    db = get_db()
-    user = db.execute('SELECT is_admin FROM users WHERE id = ?', (user_id,)).fetchone()
-    if not user:
-        return None
-    
-    new_admin_status = 1 if not user['is_admin'] else 0
-    db.execute('UPDATE users SET is_admin = ? WHERE id = ?', (new_admin_status, user_id))
-    db.commit()
+    with get_write_db() as db:
+        user = db.execute('SELECT is_admin FROM users WHERE id = ?', (user_id,)).fetchone()
+        if not user:
+            return None
+        
+        new_admin_status = 1 if not user['is_admin'] else 0
+        db.execute('UPDATE users SET is_admin = ? WHERE id = ?', (new_admin_status, user_id))
     return bool(new_admin_status)
 
 
 def update_user_email_notifications(user_id, email_notifications):
     """Update user email notification preferences"""
-    db = get_db()
-    db.execute('UPDATE users SET email_notifications = ? WHERE id = ?', (email_notifications, user_id))
-    db.commit()
+    with get_write_db() as db:
+        db.execute('UPDATE users SET email_notifications = ? WHERE id = ?', (email_notifications, user_id))
 
 
 def update_user_last_login(user_id, login_time=None):
     """Update user's last login time"""
     if login_time is None:
         login_time = get_pacific_now()
-    db = get_db()
-    db.execute('UPDATE users SET last_login = ? WHERE id = ?', (login_time, user_id))
-    db.commit()
+    with get_write_db() as db:
+        db.execute('UPDATE users SET last_login = ? WHERE id = ?', (login_time, user_id))
 
 
 # Post Operations
 def create_post(title, content, author_id, tags=None):
     """Create a new post and return the post ID"""
-    db = get_db()
-    cursor = db.execute(
-        "INSERT INTO posts (title, content, author_id, tags, created) VALUES (?, ?, ?, ?, ?)",
-        (title, content, author_id, tags, get_pacific_now())
-    )
-    post_id = cursor.lastrowid
-    db.commit()
+    with get_write_db() as db:
+        cursor = db.execute(
+            _SQL_INSERT_POST,
+            (title, content, author_id, tags, get_pacific_now())
+        )
+        post_id = cursor.lastrowid
+        set_post_tags(post_id, tags)  # joins this transaction
     return post_id
 
 
+def set_post_tags(post_id, tags):
+    """Replace the post_tags rows for a post from its comma-separated tags"""
+    with get_write_db() as db:
+        db.execute('DELETE FROM post_tags WHERE post_id = ?', (post_id,))
+        db.executemany('INSERT OR IGNORE INTO post_tags (post_id, tag) VALUES (?, ?)',
+                       [(post_id, tag) for tag in split_tags(tags)])
+
+
 def get_posts_by_date_range(year_month):
     """Get posts for a specific month (format: YYYY-MM)"""
     db = get_db()
@@ -178,7 +205,7 @@ def get_posts_by_date_range(year_month):
         SELECT p.*, u.name as author_name 
         FROM posts p 
         LEFT JOIN users u ON p.author_id = u.id 
-        WHERE strftime('%Y-%m', p.created) = ?
+        WHERE substr(p.created, 1, 7) = ?
         ORDER BY p.created DESC
     ''', (year_month,)).fetchall()
 
@@ -188,11 +215,12 @@ def get_posts_by_tag(tag_filter):
     db = get_db()
     return db.execute('''
         SELECT p.*, u.name as author_name 
-        FROM posts p 
+        FROM post_tags t 
+        JOIN posts p ON p.id = t.post_id 
         LEFT JOIN users u ON p.author_id = u.id 
-        WHERE p.tags = ? OR p.tags LIKE ? OR p.tags LIKE ? OR p.tags LIKE ?
+        WHERE t.tag = ?
         ORDER BY p.created DESC
-    ''', (tag_filter, f'{tag_filter},%', f'%,{tag_filter},%', f'%,{tag_filter}')).fetchall()
+    ''', (tag_filter.strip().lower(),)).fetchall()
 
 
 def get_all_posts():
@@ -214,23 +242,17 @@ def get_post_by_id(post_id):
 
 def delete_post(post_id):
     """Delete a post and all related data"""
-    db = get_db()
-    # Delete related data first
-    db.execute('DELETE FROM images WHERE post_id = ?', (post_id,))
-    db.execute('DELETE FROM comments WHERE post_id = ?', (post_id,))
-    db.execute('DELETE FROM reactions WHERE post_id = ?', (post_id,))
-    # Delete the post
-    db.execute('DELETE FROM posts WHERE id = ?', (post_id,))
-    db.commit()
+    with get_write_db() as db:
+        # trg_posts_delete removes the post's images, comments, reactions and tags
+        db.execute('DELETE FROM posts WHERE id = ?', (post_id,))
 
 
 # Comment Operations
 def create_comment(post_id, user_id, content, parent_comment_id=None):
     """Create a new comment"""
-    db = get_db()
-    db.execute('INSERT INTO comments (post_id, user_id, content, parent_comment_id) VALUES (?, ?, ?, ?)',
-               (post_id, user_id, content, parent_comment_id))
-    db.commit()
+    with get_write_db() as db:
+        db.execute('INSERT INTO comments (post_id, user_id, content, parent_comment_id) VALUES (?, ?, ?, ?)',
+                   (post_id, user_id, content, parent_comment_id))
 
 
 def get_comments_for_post(post_id):
@@ -260,41 +282,49 @@ def check_user_reaction(post_id, user_id, reaction_type='heart'):
     """Check if user has reacted to a post"""
     db = get_db()
     result = db.execute(
-        'SELECT id FROM reactions WHERE post_id = ? AND user_id = ? AND reaction_type = ?',
+        'SELECT EXISTS(SELECT 1 FROM reactions WHERE post_id = ? AND user_id = ? AND reaction_type = ?)',
         (post_id, user_id, reaction_type)
     ).fetchone()
-    return result is not None
+    return bool(result[0])
+
+
+def get_reaction_counts_for_posts(post_ids, user_id, reaction_type='heart'):
+    """Get {post_id: (reaction_count, user_reacted)} for many posts in one query"""
+    if not post_ids:
+        return {}
+    db = get_db()
+    placeholders = ','.join('?' * len(post_ids))
+    rows = db.execute(f'''
+        SELECT post_id, COUNT(*) as count,
+               COUNT(CASE WHEN user_id = ? THEN 1 END) as mine
+        FROM reactions 
+        WHERE reaction_type = ? AND post_id IN ({placeholders})
+        GROUP BY post_id
+    ''', (user_id, reaction_type, *post_ids)).fetchall()
+    return {row['post_id']: (row['count'], bool(row['mine'])) for row in rows}
 
 
 def toggle_reaction(post_id, user_id, reaction_type='heart'):
     """Toggle user reaction on a post. Returns (reaction_count, user_hearted)"""
-    db = get_db()
-    
-    # Check if user already hearted this post
-    existing = db.execute(
-        'SELECT id FROM reactions WHERE post_id = ? AND user_id = ? AND reaction_type = ?',
-        (post_id, user_id, reaction_type)
-    ).fetchone()
-    
-    hearted = False
-    if existing:
-        # Remove the reaction
-        db.execute('DELETE FROM reactions WHERE id = ?', (existing['id'],))
-    else:
-        # Add the reaction
-        db.execute(
-            'INSERT INTO reactions (post_id, user_id, reaction_type) VALUES (?, ?, ?)',
+    # One write transaction: the UNIQUE(post_id, user_id, reaction_type) key turns
+    # the insert into a no-op when the reaction exists, in which case we remove it
+    with get_write_db() as db:
+        cursor = db.execute(
+            'INSERT OR IGNORE INTO reactions (post_id, user_id, reaction_type) VALUES (?, ?, ?)',
             (post_id, user_id, reaction_type)
         )
-        hearted = True
-    
-    db.commit()
-    
-    # Get updated count
-    count = db.execute(
-        'SELECT COUNT(*) as count FROM reactions WHERE post_id = ? AND reaction_type = ?',
-        (post_id, reaction_type)
-    ).fetchone()['count']
+        hearted = cursor.rowcount == 1
+        if not hearted:
+            db.execute(
+                'DELETE FROM reactions WHERE post_id = ? AND user_id = ? AND reaction_type = ?',
+                (post_id, user_id, reaction_type)
+            )
+        
+        # Get updated count
+        count = db.execute(
+            'SELECT COUNT(*) as count FROM reactions WHERE post_id = ? AND reaction_type = ?',
+            (post_id, reaction_type)
+        ).fetchone()['count']
     
     return count, hearted
 
@@ -314,17 +344,15 @@ def get_filter_tag_names():
 
 def create_filter_tag(name, display_name, color):
     """Create a new filter tag"""
-    db = get_db()
-    db.execute('INSERT INTO filter_tags (name, display_name, color) VALUES (?, ?, ?)',
-              (name, display_name, color))
-    db.commit()
+    with get_write_db() as db:
+        db.execute('INSERT INTO filter_tags (name, display_name, color) VALUES (?, ?, ?)',
+                  (name, display_name, color))
 
 
 def delete_filter_tag(tag_id):
     """Delete a filter tag"""
-    db = get_db()
-    db.execute('DELETE FROM filter_tags WHERE id = ?', (tag_id,))
-    db.commit()
+    with get_write_db() as db:
+        db.execute('DELETE FROM filter_tags WHERE id = ?', (tag_id,))
 
 
 # Settings and Configuration Operations  
@@ -375,123 +403,96 @@ def get_email_template_by_id(template_id):
 def update_email_template(template_id, display_name, description, subject_template, 
                          html_template, plain_template, variables, is_active):
     """Update an email template"""
-    db = get_db()
-    db.execute('''UPDATE email_templates 
-                 SET display_name = ?, description = ?, subject_template = ?, 
-                     html_template = ?, plain_template = ?, variables = ?, 
-                     is_active = ?, updated = CURRENT_TIMESTAMP 
-                 WHERE id = ?''',
-              (display_name, description, subject_template, html_template, 
-               plain_template, variables, is_active, template_id))
-    db.commit()
+    with get_write_db() as db:
+        db.execute('''UPDATE email_templates 
+                     SET display_name = ?, description = ?, subject_template = ?, 
+                         html_template = ?, plain_template = ?, variables = ?, 
+                         is_active = ?, updated = CURRENT_TIMESTAMP 
+                     WHERE id = ?''',
+                  (display_name, description, subject_template, html_template, 
+                   plain_template, variables, is_active, template_id))
 
 
 def create_default_email_templates(templates_data):
     """Create multiple email templates from template data"""
-    db = get_db()
-    created_count = 0
-    
-    for template in templates_data:
-        existing = db.execute('SELECT id FROM email_templates WHERE template_name = ?',
-                             (template['template_name'],)).fetchone()
-        if not existing:
-            db.execute('''INSERT INTO email_templates 
+    # Hold the write lock from the existence check through the inserts
+    with get_write_db() as db:
+        existing = {row['template_name'] for row in
+                    db.execute('SELECT template_name FROM email_templates').fetchall()}
+        
+        rows = []
+        for template in templates_data:
+            if template['template_name'] in existing:
+                continue
+            existing.add(template['template_name'])
+            rows.append((template['template_name'], template['display_name'],
+                         template['description'], template['subject_template'],
+                         template['html_template'], template['plain_template'],
+                         template['variables']))
+        
+        db.executemany('''INSERT INTO email_templates 
                          (template_name, display_name, description, subject_template, 
                           html_template, plain_template, variables)
-                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                      (template['template_name'], template['display_name'], 
-                       template['description'], template['subject_template'],
-                       template['html_template'], template['plain_template'], 
-                       template['variables']))
-            created_count += 1
-    
-    db.commit()
-    return created_count
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+    return len(rows)
 
 
 # User Notification Preferences
 def get_user_notification_preferences(user_id):
     """Get user notification preferences"""
     db = get_db()
-    try:
-        prefs = db.execute('SELECT * FROM user_notification_preferences WHERE user_id = ?', 
-                          (user_id,)).fetchone()
-        return prefs
-    except sqlite3.OperationalError:
-        # Table might not exist, try to create it
-        try:
-            db.execute('''CREATE TABLE IF NOT EXISTS user_notification_preferences (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                account_created INTEGER DEFAULT 1,
-                new_post INTEGER DEFAULT 1,
-                major_event INTEGER DEFAULT 1,
-                comment_reply INTEGER DEFAULT 1,
-                updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )''')
-            db.commit()
-            return None
-        except Exception as create_error:
-            print(f"Error creating table: {create_error}")
-            raise
+    return db.execute('SELECT * FROM user_notification_preferences WHERE user_id = ?', 
+                      (user_id,)).fetchone()
 
 
 def create_default_user_notification_preferences(user_id):
     """Create default notification preferences for a user"""
-    db = get_db()
-    db.execute('''INSERT INTO user_notification_preferences 
-                 (user_id, account_created, new_post, major_event, comment_reply)
-                 VALUES (?, 1, 1, 1, 1)''', (user_id,))
-    db.commit()
-    return db.execute('SELECT * FROM user_notification_preferences WHERE user_id = ?', 
-                     (user_id,)).fetchone()
+    with get_write_db() as db:
+        if _HAS_RETURNING:
+            return db.execute(_SQL_INSERT_DEFAULT_PREFS + ' RETURNING *', (user_id,)).fetchone()
+        db.execute(_SQL_INSERT_DEFAULT_PREFS, (user_id,))
+        return db.execute('SELECT * FROM user_notification_preferences WHERE user_id = ?', 
+                         (user_id,)).fetchone()
 
 
 def update_user_notification_preferences(user_id, new_post, major_event, comment_reply):
     """Update user notification preferences"""
-    db = get_db()
-    db.execute('''UPDATE user_notification_preferences 
-                 SET new_post = ?, major_event = ?, comment_reply = ?
-                 WHERE user_id = ?''',
-               (new_post, major_event, comment_reply, user_id))
-    db.commit()
+    with get_write_db() as db:
+        db.execute('''UPDATE user_notification_preferences 
+                     SET new_post = ?, major_event = ?, comment_reply = ?
+                     WHERE user_id = ?''',
+                   (new_post, major_event, comment_reply, user_id))
 
 
 # Image Operations
-def get_individual_images(limit=50, sort_order='newest'):
-    """Get individual images from the images table"""
-    db = get_db()
-    
-    if sort_order == 'oldest':
-        order_clause = 'ORDER BY i.extracted_date ASC'
-    else:
-        order_clause = 'ORDER BY i.extracted_date DESC'
-    
-    query = f'''
+_SQL_IMAGES_SELECT = '''
         SELECT i.*, p.title as post_title, p.created as post_date, u.name as author_name
         FROM images i 
         JOIN posts p ON i.post_id = p.id 
         LEFT JOIN users u ON p.author_id = u.id 
-        {order_clause}
-        LIMIT ?
-    '''
-    
-    return db.execute(query, (limit,)).fetchall()
+        '''
+_SQL_IMAGES_NEWEST = _SQL_IMAGES_SELECT + 'ORDER BY i.extracted_date DESC LIMIT ?'
+_SQL_IMAGES_OLDEST = _SQL_IMAGES_SELECT + 'ORDER BY i.extracted_date ASC LIMIT ?'
+
+
+def get_individual_images(limit=50, sort_order='newest'):
+    """Get individual images from the images table"""
+    db = get_db()
+    sql = _SQL_IMAGES_OLDEST if sort_order == 'oldest' else _SQL_IMAGES_NEWEST
+    return db.execute(sql, (limit,)).fetchall()
+
+
+# Settings stored as 'true'/'false' strings
+BOOL_SETTING_KEYS = frozenset(('smtp_use_tls', 'notifications_enabled'))
 
 
 def update_settings_batch(settings_data):
     """Update multiple settings at once"""
-    db = get_db()
-    for setting_key, value in settings_data.items():
-        # Handle boolean settings
-        if setting_key in ['smtp_use_tls', 'notifications_enabled']:
-            value = 'true' if value else 'false'
-        
-        db.execute('UPDATE settings SET value = ?, updated = CURRENT_TIMESTAMP WHERE key = ?',
-                  (value, setting_key))
-    
-    db.commit()
+    rows = [(('true' if value else 'false') if key in BOOL_SETTING_KEYS else value, key)
+            for key, value in settings_data.items()]
+    with get_write_db() as db:
+        db.executemany(_SQL_UPDATE_SETTING, rows)
+    g.pop('_settings', None)
 
 
 # Activity Log Operations
@@ -524,42 +525,28 @@ def get_email_logs_stats():
     """Get email log statistics"""
     db = get_db()
     
-    total_emails = db.execute('SELECT COUNT(*) as count FROM email_logs').fetchone()
-    
-    successful_emails = db.execute(
-        'SELECT COUNT(*) as count FROM email_logs WHERE status = ?', ('sent',)
-    ).fetchone()
-    
-    failed_emails = db.execute('''
-        SELECT COUNT(*) as count FROM email_logs 
-        WHERE status IN ('failed', 'error')
+    # One pass over email_logs (served from idx_email_logs_status) for all three counts
+    stats = db.execute('''
+        SELECT COUNT(*) as total,
+               COUNT(CASE WHEN status = 'sent' THEN 1 END) as successful,
+               COUNT(CASE WHEN status IN ('failed', 'error') THEN 1 END) as failed
+        FROM email_logs
     ''').fetchone()
     
     return {
-        'total': total_emails['count'] if total_emails else 0,
-        'successful': successful_emails['count'] if successful_emails else 0,
-        'failed': failed_emails['count'] if failed_emails else 0
+        'total': stats['total'],
+        'successful': stats['successful'],
+        'failed': stats['failed']
     }
 
 
 # About Us Operations
 def get_about_us_content():
     """Get the about us content"""
-    import sqlite3
-    conn = sqlite3.connect('familybook.db')
-    cursor = conn.cursor()
-    
-    # Create about_us table if it doesn't exist
-    cursor.execute('''CREATE TABLE IF NOT EXISTS about_us 
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                      content TEXT NOT NULL, 
-                      updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    cursor.execute('SELECT content FROM about_us ORDER BY id DESC LIMIT 1')
-    result = cursor.fetchone()
-    conn.close()
+    db = get_db()
+    result = db.execute('SELECT content FROM about_us ORDER BY id DESC LIMIT 1').fetchone()
     
-    return result[0] if result else """
+    return result['content'] if result else """
     <h2>Welcome to Our Family Book</h2>
     <p>This is where we share our memories, photos, and stay connected as a family.</p>
     <p>Use the admin panel to customize this page and add your own family story.</p>
@@ -568,16 +555,5 @@ def get_about_us_content():
 
 def update_about_us_content(content):
     """Update the about us content"""
-    import sqlite3
-    conn = sqlite3.connect('familybook.db')
-    cursor = conn.cursor()
-    
-    # Create table if it doesn't exist
-    cursor.execute('''CREATE TABLE IF NOT EXISTS about_us 
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                      content TEXT NOT NULL, 
-                      updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    cursor.execute('INSERT INTO about_us (content) VALUES (?)', (content,))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    with get_write_db() as db:
+        db.execute('INSERT INTO about_us (content) VALUES (?)', (content,))
\ No newline at end of file
@@ -4,6 +4,7 @@ Fix email templates by converting Handlebars syntax to Jinja2 syntax.
 
 Converts:
 - {{#variable}} ... {{/variable}} → {% if variable %} ... {% endif %}
+- {{#each list}} ... {{/each}} → {% for item in list %} ... {% endfor %}
 - {{variable}} → {{ variable }} (these stay the same)
 """
 
@@ -17,22 +18,62 @@ sys.path.insert(0, os.path.dirname(__file__))
 from app import app
 from db.database import get_db
 
+_UPDATE_TEMPLATE_SQL = '''UPDATE email_templates 
+                         SET html_body = ?, plain_body = ? 
+                         WHERE id = ?'''
+
+# A whole {{#block}} ... {{/block}} section, for the before/after preview
+_HANDLEBARS_BLOCK = re.compile(r'\{\{#\w+\}\}.*?\{\{/\w+\}\}', re.DOTALL)
+
+# {{#each list}} needs whitespace before the list name; {{#each}} and {{#eachfoo}}
+# are ordinary {{#variable}} conditionals
+_EACH_TAG = re.compile(r'#each\s+(\w+)')
+
+def _is_word(name):
+    """True for a non-empty run of letters, digits and underscores"""
+    return bool(name) and name.replace('_', 'a').isalnum()
+
+def _handlebars_tag_to_jinja2(tag):
+    """Return the Jinja2 equivalent of the text inside {{ }}, or None if it is not
+    a Handlebars block tag ({{#each list}}, {{#variable}}, {{/each}}, {{/variable}})"""
+    each = _EACH_TAG.fullmatch(tag)
+    if each:
+        return '{% for item in ' + each.group(1) + ' %}'
+    # Closes the {% for %} above (the old sub chain turned this into {% endif %})
+    if tag == '/each':
+        return '{% endfor %}'
+    if tag[:1] == '#' and _is_word(tag[1:]):
+        return '{% if ' + tag[1:] + ' %}'
+    if tag[:1] == '/' and _is_word(tag[1:]):
+        return '{% endif %}'
+    return None
+
 def convert_handlebars_to_jinja2(template_content):
     """Convert Handlebars template syntax to Jinja2"""
     if not template_content:
         return template_content
     
-    # Convert {{#variable}} to {% if variable %}
-    content = re.sub(r'\{\{#(\w+)\}\}', r'{% if \1 %}', template_content)
-    
-    # Convert {{/variable}} to {% endif %}
-    content = re.sub(r'\{\{/\w+\}\}', '{% endif %}', content)
-    
-    # Handle {{#each}} loops if they exist
-    content = re.sub(r'\{\{#each (\w+)\}\}', r'{% for item in \1 %}', content)
-    content = re.sub(r'\{\{/each\}\}', '{% endfor %}', content)
-    
-    return content
+    # Walk the {{ ... }} pairs with str.find and copy the text between them
+    out = []
+    i = 0
+    while True:
+        start = template_content.find('{{', i)
+        if start < 0:
+            break
+        end = template_content.find('}}', start + 2)
+        if end < 0:
+            break
+        replacement = _handlebars_tag_to_jinja2(template_content[start + 2:end])
+        if replacement is None:
+            # Plain {{variable}} (or stray braces): keep it, rescan from the next character
+            out.append(template_content[i:start + 1])
+            i = start + 1
+            continue
+        out.append(template_content[i:start])
+        out.append(replacement)
+        i = end + 2
+    out.append(template_content[i:])
+    return ''.join(out)
 
 def fix_email_templates(dry_run=True):
     """Fix all email templates by converting syntax"""
@@ -45,6 +86,8 @@ def fix_email_templates(dry_run=True):
         print(f"Found {len(templates)} email templates to check:\n")
         
         changes_made = 0
+        updates = []  # (html_body, plain_body, id) rows, written in one batch
+        lines = []  # Report output, written to stdout in one go
         
         for template in templates:
             template_id = template['id']
@@ -52,55 +95,64 @@ def fix_email_templates(dry_run=True):
             html_body = template['html_body'] or ''
             plain_body = template['plain_body'] or ''
             
-            print(f"=== Template: {template_name} (ID: {template_id}) ===")
+            lines.append(f"=== Template: {template_name} (ID: {template_id}) ===")
             
-            # Check if conversion is needed
-            needs_html_fix = '{{#' in html_body or '{{/' in html_body
-            needs_plain_fix = '{{#' in plain_body or '{{/' in plain_body
+            # Convert templates; only bodies whose text actually changed need writing
+            new_html_body = convert_handlebars_to_jinja2(html_body)
+            new_plain_body = convert_handlebars_to_jinja2(plain_body)
+            needs_html_fix = new_html_body != html_body
+            needs_plain_fix = new_plain_body != plain_body
             
             if not needs_html_fix and not needs_plain_fix:
-                print("  ✓ No Handlebars syntax found - template is OK")
+                lines.append("  ✓ No Handlebars syntax found - template is OK")
                 continue
             
-            # Convert templates
-            new_html_body = convert_handlebars_to_jinja2(html_body)
-            new_plain_body = convert_handlebars_to_jinja2(plain_body)
-            
             # Show changes
             if needs_html_fix:
-                print("  HTML Body Changes:")
+                lines.append("  HTML Body Changes:")
                 if '{{#' in html_body:
-                    handlebars_matches = re.findall(r'\{\{#\w+\}\}.*?\{\{/\w+\}\}', html_body, re.DOTALL)
+                    handlebars_matches = _HANDLEBARS_BLOCK.findall(html_body)
                     for i, match in enumerate(handlebars_matches[:3]):  # Show first 3 matches
-                        print(f"    BEFORE: {match[:100]}...")
+                        lines.append(f"    BEFORE: {match[:100]}...")
                         converted = convert_handlebars_to_jinja2(match)
-                        print(f"    AFTER:  {converted[:100]}...")
+                        lines.append(f"    AFTER:  {converted[:100]}...")
                 
             if needs_plain_fix:
-                print("  Plain Body Changes:")
+                lines.append("  Plain Body Changes:")
                 if '{{#' in plain_body:
-                    handlebars_matches = re.findall(r'\{\{#\w+\}\}.*?\{\{/\w+\}\}', plain_body, re.DOTALL)
+                    handlebars_matches = _HANDLEBARS_BLOCK.findall(plain_body)
                     for i, match in enumerate(handlebars_matches[:2]):  # Show first 2 matches
-                        print(f"    BEFORE: {match[:100]}...")
+                        lines.append(f"    BEFORE: {match[:100]}...")
                         converted = convert_handlebars_to_jinja2(match)
-                        print(f"    AFTER:  {converted[:100]}...")
+                        lines.append(f"    AFTER:  {converted[:100]}...")
             
             if dry_run:
-                print("  [DRY RUN] Would update this template")
+                lines.append("  [DRY RUN] Would update this template")
             else:
-                # Update the database
-                try:
-                    db.execute('''UPDATE email_templates 
-                                SET html_body = ?, plain_body = ? 
-                                WHERE id = ?''',
-                             (new_html_body, new_plain_body, template_id))
-                    db.commit()
-                    print("  ✓ Template updated successfully")
-                    changes_made += 1
-                except Exception as e:
-                    print(f"  ✗ Failed to update template: {e}")
+                updates.append((new_html_body, new_plain_body, template_id))
             
-            print()
+            lines.append('')
+        
+        if lines:
+            sys.stdout.write('\n'.join(lines) + '\n')
+        
+        if updates:
+            # Update the database in one transaction
+            try:
+                db.executemany(_UPDATE_TEMPLATE_SQL, updates)
+                db.commit()
+                changes_made = len(updates)
+            except Exception as e:
+                db.rollback()
+                print(f"✗ Batch update failed ({e}), retrying templates one at a time")
+                for row in updates:
+                    try:
+                        db.execute(_UPDATE_TEMPLATE_SQL, row)
+                        db.commit()
+                        changes_made += 1
+                    except Exception as e:
+                        db.rollback()
+                        print(f"  ✗ Failed to update template {row[2]}: {e}")
         
         if dry_run:
             print("\n=== DRY RUN MODE ===")
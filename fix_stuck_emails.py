@@ -16,19 +16,25 @@ from db.database import get_db
 from services.email_service import send_templated_email
 from utils.timezone_utils import get_pacific_timezone
 
-def fix_stuck_emails(dry_run=True):
+def fix_stuck_emails(dry_run=True, limit=None):
     """Fix emails stuck in pending or retry status"""
     with app.app_context():
         db = get_db()
         
-        # Get all stuck emails (pending or retry status)
-        stuck_emails = db.execute("""
-            SELECT el.*, u.email, u.name, u.magic_token 
+        # Get all stuck emails (pending or retry status), only the columns used below
+        query = """
+            SELECT el.id, el.status, el.recipient_email, el.template_name, el.subject,
+                   el.sent_at, el.error_message, el.user_id, u.name
             FROM email_logs el
             LEFT JOIN users u ON el.user_id = u.id
             WHERE el.status IN ('pending', 'retry')
             ORDER BY el.sent_at DESC
-        """).fetchall()
+        """
+        params = ()
+        if limit:
+            query += "            LIMIT ?\n"
+            params = (limit,)
+        stuck_emails = db.execute(query, params).fetchall()
         
         if not stuck_emails:
             print("No stuck emails found!")
@@ -36,15 +42,18 @@ def fix_stuck_emails(dry_run=True):
         
         print(f"Found {len(stuck_emails)} stuck emails:\n")
         
+        # Build the report in memory and write it in one go
+        lines = []
         for email in stuck_emails:
-            print(f"ID: {email['id']}")
-            print(f"  Status: {email['status']}")
-            print(f"  Recipient: {email['recipient_email']} ({email['name'] or 'Unknown'})")
-            print(f"  Template: {email['template_name']}")
-            print(f"  Subject: {email['subject']}")
-            print(f"  Sent at: {email['sent_at']}")
-            print(f"  Error: {email['error_message'] or 'None'}")
-            print("")
+            lines.append(f"ID: {email['id']}")
+            lines.append(f"  Status: {email['status']}")
+            lines.append(f"  Recipient: {email['recipient_email']} ({email['name'] or 'Unknown'})")
+            lines.append(f"  Template: {email['template_name']}")
+            lines.append(f"  Subject: {email['subject']}")
+            lines.append(f"  Sent at: {email['sent_at']}")
+            lines.append(f"  Error: {email['error_message'] or 'None'}")
+            lines.append("")
+        sys.stdout.write('\n'.join(lines) + '\n')
         
         if dry_run:
             print("\n=== DRY RUN MODE ===")
@@ -57,70 +66,79 @@ def fix_stuck_emails(dry_run=True):
         else:
             print("\n=== EXECUTING FIXES ===\n")
             
-            # Fix each stuck email
-            for email in stuck_emails:
+            # sent_at is stored as Pacific local time ('%Y-%m-%d %H:%M:%S', see
+            # get_pacific_now), so the cutoffs compare directly as strings in SQL
+            pacific_tz = get_pacific_timezone()
+            now = datetime.now(pacific_tz)
+            cutoff_24h = (now - timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S')
+            
+            # Work on exactly the stuck emails listed above, even if --limit was given
+            # or new emails get logged while this runs
+            db.execute("CREATE TEMP TABLE IF NOT EXISTS stuck_email_ids (id INTEGER PRIMARY KEY)")
+            db.execute("DELETE FROM stuck_email_ids")
+            db.executemany("INSERT INTO stuck_email_ids (id) VALUES (?)",
+                           [(email['id'],) for email in stuck_emails])
+            
+            # Welcome emails less than 24 hours old are the only ones worth resending;
+            # pick them out before the bulk updates below mark everything else failed
+            valid_sent_at = "el.sent_at GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'"
+            resend_emails = db.execute(f"""
+                SELECT el.id, el.recipient_email, el.user_id, u.name
+                FROM email_logs el
+                JOIN stuck_email_ids s ON s.id = el.id
+                LEFT JOIN users u ON el.user_id = u.id
+                WHERE el.template_name = 'account_created' AND el.user_id IS NOT NULL
+                  AND {valid_sent_at} AND el.sent_at >= ?
+            """, (cutoff_24h,)).fetchall()
+            db.executemany("DELETE FROM stuck_email_ids WHERE id = ?",
+                           [(email['id'],) for email in resend_emails])
+            
+            # Mark everything else failed with one UPDATE per category
+            bulk_updates = [
+                ('Could not parse timestamp', f"NOT ({valid_sent_at}) OR el.sent_at IS NULL", ()),
+                ('Email too old to resend', "el.sent_at < ?", (cutoff_24h,)),
+                ('Stuck email cleanup', "1", ()),
+            ]
+            for error_message, predicate, params in bulk_updates:
+                cursor = db.execute(f"""
+                    UPDATE email_logs AS el SET status = 'failed', error_message = ?
+                    WHERE el.id IN (SELECT id FROM stuck_email_ids)
+                      AND el.status IN ('pending', 'retry') AND ({predicate})
+                """, (error_message, *params))
+                print(f"Marked {cursor.rowcount} emails as failed: {error_message}")
+            db.commit()
+            
+            # (error_message, id) for every resent email, written in one batch
+            failed_updates = []
+            
+            for email in resend_emails:
                 email_id = email['id']
-                template_name = email['template_name']
+                print(f"Email {email_id}: Attempting to resend welcome email to {email['recipient_email']}")
                 
-                # Parse the sent_at timestamp
                 try:
-                    sent_time = datetime.fromisoformat(email['sent_at'].replace(' ', 'T'))
-                    # If no timezone info, assume Pacific
-                    if sent_time.tzinfo is None:
-                        pacific_tz = get_pacific_timezone()
-                        sent_time = pacific_tz.localize(sent_time)
-                except:
-                    print(f"Could not parse timestamp for email {email_id}, marking as failed")
-                    db.execute("UPDATE email_logs SET status = 'failed', error_message = ? WHERE id = ?",
-                             ('Could not parse timestamp', email_id))
-                    db.commit()
-                    continue
-                
-                # Get current Pacific time
-                pacific_tz = get_pacific_timezone()
-                now = datetime.now(pacific_tz)
-                age_hours = (now - sent_time).total_seconds() / 3600
-                
-                # Decision logic
-                if age_hours > 24:
-                    # Emails older than 24 hours: mark as failed
-                    print(f"Email {email_id}: Too old ({age_hours:.1f} hours), marking as failed")
-                    db.execute("UPDATE email_logs SET status = 'failed', error_message = ? WHERE id = ?",
-                             ('Email too old to resend', email_id))
-                elif template_name == 'account_created' and email['user_id'] and age_hours < 48:
-                    # Welcome emails less than 48 hours old: try to resend
-                    print(f"Email {email_id}: Attempting to resend welcome email to {email['recipient_email']}")
+                    # Resend using the email service
+                    success = send_templated_email(
+                        template_name='account_created',
+                        to_email=email['recipient_email'],
+                        user_id=email['user_id'],
+                        user_name=email['name'],
+                        family_name='Fernwood'  # You may need to adjust this
+                    )
                     
-                    try:
-                        # Resend using the email service
-                        success = send_templated_email(
-                            template_name='account_created',
-                            to_email=email['recipient_email'],
-                            user_id=email['user_id'],
-                            user_name=email['name'],
-                            family_name='Fernwood'  # You may need to adjust this
-                        )
-                        
-                        if success:
-                            # Mark original as failed but note it was resent
-                            db.execute("UPDATE email_logs SET status = 'failed', error_message = ? WHERE id = ?",
-                                     ('Resent as new email', email_id))
-                            print(f"  ✓ Resent successfully")
-                        else:
-                            db.execute("UPDATE email_logs SET status = 'failed', error_message = ? WHERE id = ?",
-                                     ('Resend attempt failed', email_id))
-                            print(f"  ✗ Resend failed")
-                    except Exception as e:
-                        db.execute("UPDATE email_logs SET status = 'failed', error_message = ? WHERE id = ?",
-                                 (f'Resend error: {str(e)}', email_id))
-                        print(f"  ✗ Error resending: {e}")
-                else:
-                    # Other emails: mark as failed
-                    print(f"Email {email_id}: Marking as failed (type: {template_name})")
-                    db.execute("UPDATE email_logs SET status = 'failed', error_message = ? WHERE id = ?",
-                             ('Stuck email cleanup', email_id))
-                
-                db.commit()
+                    if success:
+                        # Mark original as failed but note it was resent
+                        failed_updates.append(('Resent as new email', email_id))
+                        print(f"  ✓ Resent successfully")
+                    else:
+                        failed_updates.append(('Resend attempt failed', email_id))
+                        print(f"  ✗ Resend failed")
+                except Exception as e:
+                    failed_updates.append((f'Resend error: {str(e)}', email_id))
+                    print(f"  ✗ Error resending: {e}")
+            
+            db.executemany("UPDATE email_logs SET status = 'failed', error_message = ? WHERE id = ?",
+                           failed_updates)
+            db.commit()
             
             print("\n✓ All stuck emails have been processed!")
 
@@ -128,6 +146,7 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Fix emails stuck in pending/retry status')
     parser.add_argument('--execute', action='store_true', help='Actually fix the emails (without this flag, runs in dry-run mode)')
+    parser.add_argument('--limit', type=int, default=None, help='Only process the N most recent stuck emails')
     args = parser.parse_args()
     
-    fix_stuck_emails(dry_run=not args.execute)
\ No newline at end of file
+    fix_stuck_emails(dry_run=not args.execute, limit=args.limit)
\ No newline at end of file
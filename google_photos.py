@@ -1,25 +1,120 @@
+import atexit
+import io
+import multiprocessing
 import os
 import pickle
 import requests
 import json
+import shutil
+import tempfile
+import threading
 import uuid
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 # Allow HTTP for development/testing (disable HTTPS requirement)
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
 from google_auth_oauthlib.flow import InstalledAppFlow, Flow
 from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from googleapiclient.discovery import build_from_document
 from googleapiclient.discovery import build
 
+# Parse Photos/Picker API responses with orjson when it is installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Resize imported images with libvips when pyvips is installed, Pillow otherwise
+try:
+    import pyvips
+except ImportError:
+    pyvips = None
+
 SCOPES = [
     'https://www.googleapis.com/auth/photoslibrary.readonly',
     'https://www.googleapis.com/auth/photoslibrary.readonly.appcreateddata',
     'https://www.googleapis.com/auth/photospicker.mediaitems.readonly'
 ]
 CREDENTIALS_FILE = 'client_secret.json'  # Updated to use the correct file name
-TOKEN_FILE = 'token.pickle'
+TOKEN_FILE = 'token.json'
+LEGACY_TOKEN_FILE = 'token.pickle'  # Read once and migrated to TOKEN_FILE
 DISCOVERY_DOC_FILE = 'photoslibrary_v1_discovery.json'
+BATCH_GET_SIZE = 50  # Max ids per mediaItems.batchGet call
+# On a headless server, authentication must be done via the web flow
+AUTH_REQUIRED_MESSAGE = "Authentication required. Please authenticate via the web interface."
+
+# One pooled HTTPS session for all Photos/Picker API calls and media downloads,
+# so calls reuse kept-alive TLS connections instead of handshaking each time
+HTTP_TIMEOUT = (5, 30)  # (connect, read) seconds
+DOWNLOAD_TIMEOUT = (5, 60)
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+MAX_IMAGE_DIMENSION = 2048  # Imported images are downscaled to fit this box
+SMALL_IMAGE_BYTES = 500 * 1024  # Smaller images already within the box are kept as is
+# Processes for re-encoding imported images; 0 does it on the download threads instead
+IMAGE_WORKERS = int(os.environ.get('FAMILYBOOK_IMAGE_WORKERS', min(4, os.cpu_count() or 1)))
+# Imports with fewer images than this resize them inline: starting the worker
+# processes costs more than the Pillow work they would take over
+IMAGE_POOL_MIN_ITEMS = 4
+# Encoder settings for resized images: 4:2:0 baseline JPEG without the extra
+# Huffman optimization pass, and zlib level 6 for PNG, encode several times
+# faster than optimize=True for a few percent larger files at 2048px
+JPEG_SAVE_OPTIONS = {'quality': 82, 'optimize': False, 'subsampling': 2, 'progressive': False}
+_VIPS_SAVE_FORMATS = {
+    'jpg': '.jpg[Q=82,strip]',
+    'jpeg': '.jpg[Q=82,strip]',
+    'png': '.png[compression=6,strip]',
+    'webp': '.webp[Q=82,strip]',
+}
+SPOOL_MAX_SIZE = 4 << 20  # Downloaded images larger than this are spooled to a temp file
+DOWNLOAD_WORKERS = 8  # Concurrent media downloads; the connection pool is sized to match
+PICKER_API_URL = 'https://photospicker.googleapis.com/v1'
+PICKER_POLL_MIN = 1.0  # Bounds in seconds for picker_poll_interval
+PICKER_POLL_MAX = 15.0
+# mime type -> (extension, filename prefix, media type, baseUrl download suffix);
+# "=d" downloads the original image, "=dv" the original video
+_EXT_MAP = {
+    'image/jpeg': ('jpg', 'img', 'image', '=d'),
+    'image/jpg': ('jpg', 'img', 'image', '=d'),
+    'image/png': ('png', 'img', 'image', '=d'),
+    'image/gif': ('gif', 'img', 'image', '=d'),
+    'image/webp': ('webp', 'img', 'image', '=d'),
+    'video/mp4': ('mp4', 'vid', 'video', '=dv'),
+    'video/quicktime': ('mov', 'vid', 'video', '=dv'),
+    'video/webm': ('webm', 'vid', 'video', '=dv'),
+}
+REFRESH_MARGIN = 300  # Refresh the access token this many seconds before it expires
+_session = requests.Session()
+_session.headers.update({'User-Agent': 'familybook/1.0'})
+_session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=2 * DOWNLOAD_WORKERS,
+    # 429 is Google's rate limit; Retry honours its Retry-After header. POST is
+    # retried too: the only POST creates a picker session, and a spare one is harmless
+    max_retries=Retry(total=5, connect=3, read=3, status=3, backoff_factor=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=frozenset(['GET', 'POST']),
+                      respect_retry_after_header=True, raise_on_status=False)
+))
+
+# Credentials and API client shared by every call in this process. The token
+# file is read again only when its mtime changes (e.g. another worker refreshed
+# it); credentials are refreshed in place when they expire and the client built
+# from them is reused.
+_creds = None
+_creds_mtime = None  # TOKEN_FILE mtime when _creds was last loaded or saved
+_service = None
+_discovery_doc = None  # Parsed Photos Library discovery document, read once per process
+_creds_lock = threading.Lock()
+_image_pool = None  # ProcessPoolExecutor for image re-encoding, started on first use
+_image_pool_lock = threading.Lock()
+_refresh_timer = None  # Background refresh scheduled ahead of token expiry
 
 # Store OAuth flows temporarily (in production, use Redis or database)
 oauth_flows = {}
@@ -66,69 +161,187 @@ def handle_oauth_callback(authorization_response, redirect_uri):
             missing_scopes = expected_scopes - actual_scopes
             print(f"Warning: Missing expected scopes: {missing_scopes}")
     
-    # Save credentials
-    with open(TOKEN_FILE, 'wb') as token:
-        pickle.dump(creds, token)
+    # Save credentials and make them the cached ones
+    _save_creds(creds)
+    _set_creds(creds)
     
     return creds
 
-def is_authenticated():
-    """Check if valid authentication exists"""
-    if not os.path.exists(TOKEN_FILE):
-        return False
-    
+def _save_creds(creds):
+    """Persist credentials to TOKEN_FILE"""
+    global _creds_mtime
+    # Write a private (0600) temp file and rename it over TOKEN_FILE, so other
+    # processes never read a half-written token
+    tmp_path = f"{TOKEN_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as token:
+        token.write(creds.to_json())
+    os.replace(tmp_path, TOKEN_FILE)
+    # Our own write shouldn't make _get_creds reload the file
+    _creds_mtime = _token_mtime()
+
+def _token_mtime():
+    """Modification time of TOKEN_FILE, or None if it doesn't exist"""
     try:
-        with open(TOKEN_FILE, 'rb') as token:
+        return os.path.getmtime(TOKEN_FILE)
+    except OSError:
+        return None
+
+def _load_creds():
+    """Load credentials from TOKEN_FILE, migrating a legacy pickle token if needed"""
+    if os.path.exists(TOKEN_FILE):
+        return Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    if os.path.exists(LEGACY_TOKEN_FILE):
+        with open(LEGACY_TOKEN_FILE, 'rb') as token:
             creds = pickle.load(token)
+        if creds:
+            _save_creds(creds)
+            os.remove(LEGACY_TOKEN_FILE)
+        return creds
+    return None
+
+def _set_creds(creds):
+    """Replace the cached credentials, dropping the client built from the old ones"""
+    global _creds, _service
+    with _creds_lock:
+        _creds = creds
+        _service = None
+        _schedule_refresh(creds)
+
+def _get_creds(error_message=AUTH_REQUIRED_MESSAGE):
+    """Return the cached credentials, (re)loading them from TOKEN_FILE when it
+    changed on disk and refreshing them only once they have expired"""
+    global _creds, _creds_mtime, _service
+    with _creds_lock:
+        creds = _creds
+        mtime = _token_mtime()
+        if creds is None or mtime != _creds_mtime:
+            creds = _creds = _load_creds()
+            _creds_mtime = _token_mtime()
+            _service = None
+            _schedule_refresh(creds)
         
-        if creds and creds.valid:
-            return True
-        
-        if creds and creds.expired and creds.refresh_token:
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+                _save_creds(creds)
+                _schedule_refresh(creds)
+            else:
+                raise Exception(error_message)
+        return creds
+
+def _refresh_creds(rejected_token=None):
+    """Force a token refresh, e.g. after the API rejected the current token.
+    Skipped if another thread already replaced rejected_token, so concurrent
+    401s (e.g. from parallel downloads) cause a single refresh"""
+    with _creds_lock:
+        if rejected_token is not None and _creds.token != rejected_token:
+            return
+        _creds.refresh(Request())
+        _save_creds(_creds)
+        _schedule_refresh(_creds)
+
+def _schedule_refresh(creds):
+    """Start a daemon timer that refreshes creds shortly before they expire,
+    so request threads rarely have to wait on the OAuth round-trip.
+    Must be called with _creds_lock held."""
+    global _refresh_timer
+    if _refresh_timer is not None:
+        _refresh_timer.cancel()
+        _refresh_timer = None
+    if not creds or not creds.refresh_token or not creds.expiry:
+        return
+    # google-auth keeps expiry as a naive UTC datetime
+    delay = (creds.expiry - datetime.utcnow()).total_seconds() - REFRESH_MARGIN
+    _refresh_timer = threading.Timer(max(delay, 1), _background_refresh, args=(creds,))
+    _refresh_timer.daemon = True
+    _refresh_timer.start()
+
+def _background_refresh(creds):
+    """Timer callback: refresh the cached credentials and schedule the next refresh"""
+    with _creds_lock:
+        # Skip if the credentials were replaced or rescheduled meanwhile
+        if creds is not _creds or _refresh_timer is not threading.current_thread():
+            return
+        try:
             creds.refresh(Request())
-            with open(TOKEN_FILE, 'wb') as token:
-                pickle.dump(creds, token)
-            return True
+            _save_creds(creds)
+        except Exception as e:
+            # Leave it to the next request to refresh inline
+            print(f"Background token refresh failed: {e}")
+            return
+        _schedule_refresh(creds)
+
+def _auth_headers(error_message=AUTH_REQUIRED_MESSAGE):
+    """Authorization headers for the current (refreshed if expired) access token"""
+    creds = _get_creds(error_message)
+    return {
+        'Authorization': f'Bearer {creds.token}',
+        'Content-Type': 'application/json'
+    }
+
+def _call(method, url, error_message=AUTH_REQUIRED_MESSAGE, timeout=HTTP_TIMEOUT, **kwargs):
+    """Make an authenticated API request, refreshing the token and retrying once on 401"""
+    headers = _auth_headers(error_message)
+    response = _session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+    if response.status_code == 401:
+        # Token expired, refresh and retry (releasing the connection of a streamed response)
+        response.close()
+        _refresh_creds(headers['Authorization'].split(' ', 1)[1])
+        response = _session.request(method, url, headers=_auth_headers(error_message),
+                                    timeout=timeout, **kwargs)
+    return response
+
+def is_authenticated():
+    """Check if valid authentication exists"""
+    try:
+        _get_creds()
+        return True
     except Exception:
-        pass
-    
-    return False
+        return False
 
 
 def get_authenticated_service():
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-            with open(TOKEN_FILE, 'wb') as token:
-                pickle.dump(creds, token)
-        else:
-            # On a headless server, we can't use run_local_server
-            # The app should handle authentication via web flow
-            raise Exception("Authentication required. Please authenticate via the web interface.")
-    
-    # Try to use local discovery document first
-    if os.path.exists(DISCOVERY_DOC_FILE):
+    return _get_service()
+
+def _get_service():
+    """Return the cached API client, building it on first use"""
+    global _service
+    creds = _get_creds()
+    # Rebuilding parses the discovery document and opens a new HTTPS
+    # connection; the client refreshes the shared credentials by itself
+    with _creds_lock:
+        if _service is None:
+            _service = _build_service(creds)
+        return _service
+
+def _build_service(creds):
+    """Build a Photos Library client for the given credentials"""
+    global _discovery_doc
+    # Try the discovery document already loaded in this process, then the local file
+    if _discovery_doc is not None or os.path.exists(DISCOVERY_DOC_FILE):
         try:
-            with open(DISCOVERY_DOC_FILE, 'r') as f:
-                discovery_doc = f.read()
-            return build_from_document(discovery_doc, credentials=creds)
+            if _discovery_doc is None:
+                with open(DISCOVERY_DOC_FILE, 'rb') as f:
+                    _discovery_doc = _json_loads(f.read())
+            # build_from_document takes the parsed dict as well as the JSON text
+            return build_from_document(_discovery_doc, credentials=creds)
         except Exception as e:
             print(f"Failed to use local discovery document: {e}")
+            _discovery_doc = None
     
     # Fallback: download discovery document
     try:
         discovery_url = "https://photoslibrary.googleapis.com/$discovery/rest?version=v1"
-        response = requests.get(discovery_url)
+        response = _session.get(discovery_url, timeout=HTTP_TIMEOUT)
         if response.status_code == 200:
-            discovery_doc = response.text
+            discovery_doc = _json_loads(response.content)
+            service = build_from_document(discovery_doc, credentials=creds)
             # Save for future use
-            with open(DISCOVERY_DOC_FILE, 'w') as f:
-                f.write(discovery_doc)
-            return build_from_document(discovery_doc, credentials=creds)
+            _discovery_doc = discovery_doc
+            with open(DISCOVERY_DOC_FILE, 'wb') as f:
+                f.write(response.content)
+            return service
         else:
             raise Exception(f"Failed to fetch discovery document: HTTP {response.status_code}")
     except Exception as e:
@@ -136,11 +349,43 @@ def get_authenticated_service():
         # Final fallback: try direct API call approach
         return DirectPhotosAPI(creds)
 
-def list_recent_photos(page_size=20):
+def list_recent_photos(page_size=100, max_items=20):
+    """List the most recent library media items, following nextPageToken until
+    max_items have been collected (max_items=None walks the whole library)"""
     service = get_authenticated_service()
-    results = service.mediaItems().list(pageSize=page_size).execute()
-    items = results.get('mediaItems', [])
-    return items
+    items = []
+    page_token = None
+    while True:
+        # 100 is the API maximum; don't ask for more than is still needed
+        size = page_size if max_items is None else min(page_size, max_items - len(items))
+        results = service.mediaItems().list(pageSize=size, pageToken=page_token).execute()
+        items.extend(results.get('mediaItems', []))
+        page_token = results.get('nextPageToken')
+        if not page_token or (max_items is not None and len(items) >= max_items):
+            break
+    return items if max_items is None else items[:max_items]
+
+def _resolve_media(mime_type, is_video=False):
+    """Return (extension, filename prefix, media type, baseUrl download suffix)
+    for a mime type, defaulting to JPEG images and MP4 videos"""
+    info = _EXT_MAP.get(mime_type.lower())
+    if info is None or (is_video and info[2] != 'video'):
+        info = _EXT_MAP['video/mp4'] if is_video or mime_type.startswith('video/') else _EXT_MAP['image/jpeg']
+    return info
+
+def _stream_to_file(response, path):
+    """Write a streamed response body to path in DOWNLOAD_CHUNK_SIZE pieces;
+    returns the number of bytes written"""
+    size = 0
+    # A buffer as large as a chunk hands each chunk to the kernel in one write
+    with open(path, 'wb', buffering=DOWNLOAD_CHUNK_SIZE) as f:
+        if hasattr(os, 'posix_fadvise'):
+            # Tell the kernel the file is written front to back, once
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            f.write(chunk)
+            size += len(chunk)
+    return size
 
 def download_media(media_item, save_dir='static/imported'):
     # Check if this is a video using multiple detection methods
@@ -148,41 +393,31 @@ def download_media(media_item, save_dir='static/imported'):
     media_metadata = media_item.get('mediaMetadata', {})
     is_video = mime_type.startswith('video/') or media_metadata.get('video') is not None
     
-    # Use appropriate download parameter based on media type
-    if is_video:
-        url = media_item['baseUrl'] + "=dv"  # Download original video
-        # Determine video extension from mimeType
-        if 'mp4' in mime_type:
-            ext = 'mp4'
-        elif 'mov' in mime_type:
-            ext = 'mov'
-        elif 'webm' in mime_type:
-            ext = 'webm'
-        else:
-            ext = 'mp4'  # Default video extension
-    else:
-        url = media_item['baseUrl'] + "=d"   # Download original image
-        # Determine image extension from mimeType
-        if 'jpeg' in mime_type or 'jpg' in mime_type:
-            ext = 'jpg'
-        elif 'png' in mime_type:
-            ext = 'png'
-        elif 'gif' in mime_type:
-            ext = 'gif'
-        elif 'webp' in mime_type:
-            ext = 'webp'
-        else:
-            ext = 'jpg'  # Default image extension
+    # Extension and download parameter (original image or video) for the media type
+    ext, _, _, download_suffix = _resolve_media(mime_type, is_video)
+    url = media_item['baseUrl'] + download_suffix
     
-    response = requests.get(url)
-    if response.status_code == 200:
+    # Stream the body to disk so large videos are never held in memory
+    with _session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code != 200:
+            return None
         filename = f"{media_item['id']}.{ext}"
         path = os.path.join(save_dir, filename)
-        os.makedirs(save_dir, exist_ok=True)
-        with open(path, 'wb') as f:
-            f.write(response.content)
+        try:
+            _stream_to_file(response, path)
+        except FileNotFoundError:
+            # Only the first download into a new save_dir pays for creating it
+            os.makedirs(save_dir, exist_ok=True)
+            _stream_to_file(response, path)
         return filename
-    return None
+
+def download_media_batch(media_items, save_dir='static/imported', max_workers=DOWNLOAD_WORKERS):
+    """Download several media items concurrently; returns filenames in completion order
+    (None for failed downloads)"""
+    os.makedirs(save_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(download_media, item, save_dir) for item in media_items]
+        return [future.result() for future in as_completed(futures)]
 
 class DirectPhotosAPI:
     """Direct API calls to Google Photos as fallback"""
@@ -193,31 +428,15 @@ class DirectPhotosAPI:
     
     def _make_request(self, endpoint, method="GET", params=None, data=None):
         """Make authenticated request to Photos API"""
-        headers = {
-            'Authorization': f'Bearer {self.credentials.token}',
-            'Content-Type': 'application/json'
-        }
-        
         url = f"{self.base_url}/{endpoint}"
         
+        # Same shared credentials and 401 refresh-and-retry as the Picker calls
         if method == "GET":
-            response = requests.get(url, headers=headers, params=params)
+            return _call('GET', url, params=params)
         elif method == "POST":
-            response = requests.post(url, headers=headers, json=data)
+            return _call('POST', url, json=data)
         else:
             raise ValueError(f"Unsupported method: {method}")
-        
-        if response.status_code == 401:
-            # Token might be expired, refresh it
-            self.credentials.refresh(Request())
-            headers['Authorization'] = f'Bearer {self.credentials.token}'
-            
-            if method == "GET":
-                response = requests.get(url, headers=headers, params=params)
-            elif method == "POST":
-                response = requests.post(url, headers=headers, json=data)
-        
-        return response
     
     def mediaItems(self):
         return DirectMediaItems(self)
@@ -228,7 +447,7 @@ class DirectMediaItems:
     def __init__(self, api):
         self.api = api
     
-    def list(self, pageSize=50, pageToken=None):
+    def list(self, pageSize=100, pageToken=None):
         params = {'pageSize': pageSize}
         if pageToken:
             params['pageToken'] = pageToken
@@ -245,7 +464,7 @@ class DirectAPIResponse:
     
     def execute(self):
         if self.response.status_code == 200:
-            self._data = self.response.json()
+            self._data = _json_loads(self.response.content)
             return self._data
         else:
             raise Exception(f"API request failed: {self.response.status_code} - {self.response.text}")
@@ -256,135 +475,65 @@ class DirectAPIResponse:
         return self._data.get(key, default)
 
 
+def _picker_request(method, path, error_message=AUTH_REQUIRED_MESSAGE, **kwargs):
+    """Authenticated request to the Photos Picker API (refreshes and retries on 401)"""
+    return _call(method, f"{PICKER_API_URL}/{path}", error_message, **kwargs)
+
+
 def create_picker_session():
     """Create a Google Photos Picker session using the correct API endpoint"""
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-            with open(TOKEN_FILE, 'wb') as token:
-                pickle.dump(creds, token)
-        else:
-            # On a headless server, authentication must be done via web flow
-            raise Exception("Authentication required. Please authenticate via the web interface.")
-    
-    # Create picker session using correct Photo Picker API endpoint
-    headers = {
-        'Authorization': f'Bearer {creds.token}',
-        'Content-Type': 'application/json'
-    }
-    
-    # Request body for picker session - only include pickingConfig if needed
+    # Request body for picker session
     session_data = {
         'pickingConfig': {
             'maxItemCount': '2000'  # Allow up to 2000 items (default)
         }
     }
     
-    # Make request to Photo Picker API
-    response = requests.post(
-        'https://photospicker.googleapis.com/v1/sessions',
-        headers=headers,
-        json=session_data
-    )
-    
-    if response.status_code == 401:
-        # Token expired, refresh and retry
-        creds.refresh(Request())
-        headers['Authorization'] = f'Bearer {creds.token}'
-        response = requests.post(
-            'https://photospicker.googleapis.com/v1/sessions',
-            headers=headers,
-            json=session_data
-        )
+    # Create picker session using correct Photo Picker API endpoint
+    response = _picker_request('POST', 'sessions', json=session_data)
     
     if response.status_code in [200, 201]:
-        return response.json()
+        return _json_loads(response.content)
     else:
         raise Exception(f"Failed to create picker session: {response.status_code} - {response.text}")
 
 
 def poll_picker_session(session_id):
     """Poll a Google Photos Picker session for completion"""
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            raise Exception("No valid credentials for polling session")
-    
-    headers = {
-        'Authorization': f'Bearer {creds.token}',
-        'Content-Type': 'application/json'
-    }
-    
     # Get session status from Photo Picker API
-    response = requests.get(
-        f'https://photospicker.googleapis.com/v1/sessions/{session_id}',
-        headers=headers
-    )
-    
-    if response.status_code == 401:
-        # Token expired, refresh and retry
-        creds.refresh(Request())
-        headers['Authorization'] = f'Bearer {creds.token}'
-        response = requests.get(
-            f'https://photospicker.googleapis.com/v1/sessions/{session_id}',
-            headers=headers
-        )
+    response = _picker_request('GET', f'sessions/{session_id}',
+                               error_message="No valid credentials for polling session")
     
     if response.status_code == 200:
-        return response.json()
+        return _json_loads(response.content)
     else:
         raise Exception(f"Failed to poll picker session: {response.status_code} - {response.text}")
 
 
+def picker_poll_interval(session, attempt=0, min_interval=PICKER_POLL_MIN, max_interval=PICKER_POLL_MAX):
+    """Seconds to wait before polling a picker session again: the session's
+    pollingConfig.pollInterval hint (e.g. "5s"), backed off 1.5x per unanswered poll"""
+    interval = min_interval
+    hint = session.get('pollingConfig', {}).get('pollInterval')
+    if hint:
+        try:
+            interval = max(float(str(hint).rstrip('s')), min_interval)
+        except ValueError:
+            pass
+    return min(interval * 1.5 ** min(attempt, 10), max_interval)
+
+
 def get_picked_media_items(session_id):
     """Get picked media items from a Picker session using the correct API"""
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            raise Exception("No valid credentials for getting picked items")
-    
-    headers = {
-        'Authorization': f'Bearer {creds.token}',
-        'Content-Type': 'application/json'
-    }
-    
     # Get picked media items from Picker API
-    response = requests.get(
-        f'https://photospicker.googleapis.com/v1/mediaItems?sessionId={session_id}',
-        headers=headers
-    )
-    
-    if response.status_code == 401:
-        # Token expired, refresh and retry
-        creds.refresh(Request())
-        headers['Authorization'] = f'Bearer {creds.token}'
-        response = requests.get(
-            f'https://photospicker.googleapis.com/v1/mediaItems?sessionId={session_id}',
-            headers=headers
-        )
+    response = _picker_request('GET', 'mediaItems', params={'sessionId': session_id},
+                               error_message="No valid credentials for getting picked items")
     
     if response.status_code == 200:
-        return response.json()
+        return _json_loads(response.content)
     elif response.status_code == 400:
         # This might be a FAILED_PRECONDITION error - user hasn't finished selecting
-        error_data = response.json()
+        error_data = _json_loads(response.content)
         if 'FAILED_PRECONDITION' in str(error_data):
             return {'not_ready': True, 'error': error_data}
         else:
@@ -396,318 +545,254 @@ def get_picked_media_items(session_id):
 def get_media_item_details(media_item_ids):
     """Get details for selected media items from Photos Library API (legacy function)"""
     service = get_authenticated_service()
+    media_item_ids = list(media_item_ids)
     
     media_items = []
-    for item_id in media_item_ids:
+    # mediaItems.batchGet accepts up to BATCH_GET_SIZE ids per call
+    for start in range(0, len(media_item_ids), BATCH_GET_SIZE):
+        chunk = media_item_ids[start:start + BATCH_GET_SIZE]
         try:
-            # Use the Photos Library API to get media item details
-            if hasattr(service, 'mediaItems'):
-                media_item = service.mediaItems().get(mediaItemId=item_id).execute()
-            else:
+            if isinstance(service, DirectPhotosAPI):
                 # Fallback to direct API call
-                response = service._make_request(f'mediaItems/{item_id}')
-                if response.status_code == 200:
-                    media_item = response.json()
-                else:
+                response = service._make_request('mediaItems:batchGet',
+                                                 params=[('mediaItemIds', item_id) for item_id in chunk])
+                if response.status_code != 200:
+                    print(f"Error getting media items: {response.status_code} - {response.text}")
                     continue
-            
-            media_items.append(media_item)
+                results = _json_loads(response.content)
+            else:
+                results = service.mediaItems().batchGet(mediaItemIds=chunk).execute()
         except Exception as e:
-            print(f"Error getting media item {item_id}: {e}")
+            print(f"Error getting media items {chunk[0]}..{chunk[-1]}: {e}")
             continue
+        
+        for result in results.get('mediaItemResults', []):
+            if 'mediaItem' in result:
+                media_items.append(result['mediaItem'])
+            else:
+                print(f"Error getting media item {result.get('mediaItemId')}: {result.get('status')}")
     
     return media_items
 
 
-def download_selected_media(selected_items, upload_folder):
-    """Download and process selected media from Google Photos"""
-    import uuid
-    from flask import url_for
-    
-    imported_media = []
-    total_original_size = 0
-    total_processed_size = 0
-    
-    # Get authenticated credentials
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
+def _optimize_image(source, ext):
+    """Downscale an image file object to MAX_IMAGE_DIMENSION and re-encode it;
+    returns the new bytes, or None to keep the original"""
+    # A small file that already fits the box gains little from a decode and
+    # re-encode, so keep it as is; Image.open only parses the header here
+    size = source.seek(0, os.SEEK_END)
+    source.seek(0)
+    if size < SMALL_IMAGE_BYTES:
+        try:
+            from PIL import Image
+            with Image.open(source) as image:
+                if max(image.size) <= MAX_IMAGE_DIMENSION and image.mode == 'RGB':
+                    return None
+        except Exception:
+            pass
+        source.seek(0)
+    
+    if pyvips is not None:
+        # libvips shrinks on load and streams, so it never decodes the full image
+        try:
+            image = pyvips.Image.thumbnail_buffer(source.read(), MAX_IMAGE_DIMENSION,
+                                                  height=MAX_IMAGE_DIMENSION, size='down')
+            return image.write_to_buffer(_VIPS_SAVE_FORMATS.get(ext.lower(), _VIPS_SAVE_FORMATS['jpg']))
+        except pyvips.Error as e:
+            print(f"Error optimizing image with libvips, falling back to Pillow: {e}")
+            source.seek(0)
     
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-            with open(TOKEN_FILE, 'wb') as token:
-                pickle.dump(creds, token)
+    try:
+        from PIL import Image
+        
+        image = Image.open(source)
+        
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still covers the box
+        if ext.lower() in ['jpg', 'jpeg']:
+            image.draft('RGB', (MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION))
+        
+        # Convert to RGB if necessary
+        if image.mode in ('RGBA', 'LA', 'P') and ext.lower() in ['jpg', 'jpeg']:
+            image = image.convert('RGB')
+        
+        # Resize if too large
+        if max(image.size) > MAX_IMAGE_DIMENSION:
+            image.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.Resampling.LANCZOS)
+        
+        # Save with optimization
+        output = io.BytesIO()
+        if ext.lower() in ['jpg', 'jpeg']:
+            image.save(output, format='JPEG', **JPEG_SAVE_OPTIONS)
+        elif ext.lower() == 'png':
+            image.save(output, format='PNG', compress_level=6)
+        elif ext.lower() == 'webp':
+            image.save(output, format='WebP', quality=82, method=4)
         else:
-            raise Exception("Authentication required")
-    
-    headers = {'Authorization': f'Bearer {creds.token}'}
-    
-    for item in selected_items:
-        try:
-            # Handle PickedMediaItem structure from Picker API
-            media_file = item.get('mediaFile', {})
-            base_url = media_file.get('baseUrl')
-            filename = media_file.get('filename', f'google_photo_{uuid.uuid4().hex[:8]}.jpg')
-            mime_type = media_file.get('mimeType', 'image/jpeg')
-            
-            if not base_url:
-                continue
-            
-            # Use appropriate download parameter based on media type
-            if mime_type.startswith('video/'):
-                download_url = f"{base_url}=dv"  # Download original video
-            else:
-                download_url = f"{base_url}=d"   # Download original image
-            
-            response = requests.get(download_url, headers=headers)
-            
+            image.save(output, format='JPEG', **JPEG_SAVE_OPTIONS)
+        
+        return output.getvalue()
+        
+    except ImportError:
+        # PIL not available, use original
+        return None
+    except Exception as resize_error:
+        print(f"Error optimizing image: {resize_error}")
+        # Use original if optimization fails
+        return None
+
+
+def _optimize_image_bytes(data, ext):
+    """_optimize_image for raw bytes, so it can run in a worker process"""
+    return _optimize_image(io.BytesIO(data), ext)
+
+
+def _get_image_pool():
+    """Return the image re-encoding process pool, starting it on first use"""
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is None:
+            # spawn rather than fork: a forked copy of this multi-threaded
+            # process could inherit locks held by other threads
+            _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS,
+                                              mp_context=multiprocessing.get_context('spawn'))
+        return _image_pool
+
+
+def _shutdown_image_pool():
+    """Shut the image pool down; the next image that needs it starts a fresh one"""
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is not None:
+            _image_pool.shutdown(wait=False)
+            _image_pool = None
+
+
+atexit.register(_shutdown_image_pool)
+
+
+def _download_one(item, upload_folder, image_pool=None):
+    """Download and process one picked item; returns (media dict, original size,
+    processed size), or None if the item was skipped or failed"""
+    try:
+        # Handle PickedMediaItem structure from Picker API
+        media_file = item.get('mediaFile', {})
+        base_url = media_file.get('baseUrl')
+        filename = media_file.get('filename', f'google_photo_{uuid.uuid4().hex[:8]}.jpg')
+        mime_type = media_file.get('mimeType', 'image/jpeg')
+        
+        if not base_url:
+            return None
+        
+        # Extension, filename prefix, media type and download parameter for the mime type
+        ext, prefix, media_type, download_suffix = _resolve_media(mime_type)
+        download_url = f"{base_url}{download_suffix}"
+        
+        # Through _call so a token that expires mid-import is refreshed on 401
+        with _call('GET', download_url, "Authentication required",
+                   timeout=DOWNLOAD_TIMEOUT, stream=True) as response:
             if response.status_code == 200:
-                total_original_size += len(response.content)
-                
-                # Determine file extension and type
-                if mime_type.startswith('image/'):
-                    if 'jpeg' in mime_type or 'jpg' in mime_type:
-                        ext = 'jpg'
-                    elif 'png' in mime_type:
-                        ext = 'png'
-                    elif 'gif' in mime_type:
-                        ext = 'gif'
-                    elif 'webp' in mime_type:
-                        ext = 'webp'
-                    else:
-                        ext = 'jpg'
-                    
-                    prefix = 'img'
-                    media_type = 'image'
-                elif mime_type.startswith('video/'):
-                    if 'mp4' in mime_type:
-                        ext = 'mp4'
-                    elif 'mov' in mime_type:
-                        ext = 'mov'
-                    elif 'webm' in mime_type:
-                        ext = 'webm'
-                    else:
-                        ext = 'mp4'
-                    
-                    prefix = 'vid'
-                    media_type = 'video'
-                else:
-                    ext = 'jpg'
-                    prefix = 'img'
-                    media_type = 'image'
-                
                 # Generate unique filename
                 unique_filename = f"{prefix}_{uuid.uuid4().hex}.{ext}"
                 file_path = os.path.join(upload_folder, unique_filename)
                 
-                # Process and save the file
-                processed_content = response.content
-                
-                # For images, try to optimize with Pillow if available
-                if media_type == 'image' and ext in ['jpg', 'jpeg', 'png', 'webp']:
-                    try:
-                        from PIL import Image
-                        import io
-                        
-                        image = Image.open(io.BytesIO(response.content))
-                        
-                        # Convert to RGB if necessary
-                        if image.mode in ('RGBA', 'LA', 'P') and ext.lower() in ['jpg', 'jpeg']:
-                            image = image.convert('RGB')
-                        
-                        # Resize if too large
-                        max_dimension = 2048
-                        if max(image.size) > max_dimension:
-                            image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
-                        
-                        # Save with optimization
-                        output = io.BytesIO()
-                        if ext.lower() in ['jpg', 'jpeg']:
-                            image.save(output, format='JPEG', quality=85, optimize=True)
-                        elif ext.lower() == 'png':
-                            image.save(output, format='PNG', optimize=True)
-                        elif ext.lower() == 'webp':
-                            image.save(output, format='WebP', quality=85, optimize=True)
-                        else:
-                            image.save(output, format='JPEG', quality=85, optimize=True)
+                if media_type == 'video':
+                    # Stream videos straight to disk; only images are processed in memory
+                    original_size = processed_size = _stream_to_file(response, file_path)
+                else:
+                    # Spool the download (in memory up to SPOOL_MAX_SIZE, on disk beyond)
+                    # rather than holding the whole body in response.content
+                    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            spool.write(chunk)
+                        original_size = spool.tell()
+                        spool.seek(0)
+                        processed_content = None
                         
-                        processed_content = output.getvalue()
+                        # For images, try to downscale and re-encode them
+                        if media_type == 'image' and ext in ['jpg', 'jpeg', 'png', 'webp']:
+                            if image_pool is not None:
+                                # Decoding and encoding hold the GIL, so run them in a
+                                # worker process; this thread just waits for the result
+                                try:
+                                    processed_content = image_pool.submit(
+                                        _optimize_image_bytes, spool.read(), ext).result()
+                                except Exception as pool_error:
+                                    print(f"Image worker failed, optimizing in-process: {pool_error}")
+                                    if isinstance(pool_error, BrokenProcessPool):
+                                        _shutdown_image_pool()
+                                    spool.seek(0)
+                                    processed_content = _optimize_image(spool, ext)
+                            else:
+                                processed_content = _optimize_image(spool, ext)
                         
-                    except ImportError:
-                        # PIL not available, use original
-                        pass
-                    except Exception as resize_error:
-                        print(f"Error optimizing image: {resize_error}")
-                        # Use original if optimization fails
-                        pass
-                
-                total_processed_size += len(processed_content)
-                
-                # Save the file
-                with open(file_path, 'wb') as f:
-                    f.write(processed_content)
-                
-                # Generate URL
-                file_url = url_for('uploaded_file', filename=unique_filename, _external=True)
+                        # Save the file
+                        with open(file_path, 'wb') as f:
+                            if processed_content is None:
+                                spool.seek(0)
+                                shutil.copyfileobj(spool, f, DOWNLOAD_CHUNK_SIZE)
+                                processed_size = original_size
+                            else:
+                                f.write(processed_content)
+                                processed_size = len(processed_content)
+                    
+                print(f"Successfully imported {media_type}: {unique_filename}")
                 
-                imported_media.append({
+                return {
                     'filename': unique_filename,
                     'original_name': filename,
-                    'url': file_url,
                     'type': media_type,
                     'extension': ext,
                     'google_photo_id': item.get('id', media_file.get('id', 'unknown'))
-                })
-                
-                print(f"Successfully imported {media_type}: {unique_filename}")
-                
-        except Exception as item_error:
-            print(f"Error processing item: {str(item_error)}")
-            continue
-    
-    return {
-        'success': True,
-        'media': imported_media,
-        'count': len(imported_media),
-        'totalOriginalSize': total_original_size,
-        'totalProcessedSize': total_processed_size
-    }
-
-
-def create_picker_session():
-    """Create a Google Photos Picker session using the correct API endpoint"""
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-            with open(TOKEN_FILE, 'wb') as token:
-                pickle.dump(creds, token)
-        else:
-            # On a headless server, authentication must be done via web flow
-            raise Exception("Authentication required. Please authenticate via the web interface.")
-    
-    # Create picker session using correct Photo Picker API endpoint
-    headers = {
-        'Authorization': f'Bearer {creds.token}',
-        'Content-Type': 'application/json'
-    }
-    
-    # Request body for picker session
-    session_data = {
-        'pickingConfig': {
-            'maxItemCount': '2000'  # Allow up to 2000 items (default)
-        }
-    }
-    
-    # Make request to Photo Picker API
-    response = requests.post(
-        'https://photospicker.googleapis.com/v1/sessions',
-        headers=headers,
-        json=session_data
-    )
-    
-    if response.status_code == 401:
-        # Token expired, refresh and retry
-        creds.refresh(Request())
-        headers['Authorization'] = f'Bearer {creds.token}'
-        response = requests.post(
-            'https://photospicker.googleapis.com/v1/sessions',
-            headers=headers,
-            json=session_data
-        )
-    
-    if response.status_code in [200, 201]:
-        return response.json()
-    else:
-        raise Exception(f"Failed to create picker session: {response.status_code} - {response.text}")
+                }, original_size, processed_size
+            
+        return None
+    except Exception as item_error:
+        print(f"Error processing item: {str(item_error)}")
+        return None
 
 
-def poll_picker_session(session_id):
-    """Poll a Google Photos Picker session for completion"""
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
+def download_selected_media(selected_items, upload_folder, max_workers=DOWNLOAD_WORKERS):
+    """Download and process selected media from Google Photos"""
+    from flask import url_for
     
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            raise Exception("No valid credentials for polling session")
+    imported_media = []
+    total_original_size = 0
+    total_processed_size = 0
     
-    headers = {
-        'Authorization': f'Bearer {creds.token}',
-        'Content-Type': 'application/json'
-    }
+    # Fail fast before starting any downloads if there are no usable credentials
+    _get_creds("Authentication required")
     
-    # Get session status from Photo Picker API
-    response = requests.get(
-        f'https://photospicker.googleapis.com/v1/sessions/{session_id}',
-        headers=headers
-    )
+    os.makedirs(upload_folder, exist_ok=True)
     
-    if response.status_code == 401:
-        # Token expired, refresh and retry
-        creds.refresh(Request())
-        headers['Authorization'] = f'Bearer {creds.token}'
-        response = requests.get(
-            f'https://photospicker.googleapis.com/v1/sessions/{session_id}',
-            headers=headers
-        )
+    # The process pool is shared by every import in this process and only
+    # worth starting for imports with several images
+    image_count = sum(1 for item in selected_items
+                      if item.get('mediaFile', {}).get('mimeType', 'image/jpeg').startswith('image/'))
+    image_pool = None
+    if IMAGE_WORKERS > 0 and image_count >= IMAGE_POOL_MIN_ITEMS:
+        image_pool = _get_image_pool()
     
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Failed to poll picker session: {response.status_code} - {response.text}")
-
-
-def get_picked_media_items(session_id):
-    """Get picked media items from a Picker session using the correct API"""
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
+    # Items are independent network-bound downloads, so fetch them concurrently;
+    # sizes and URLs are collected here on the request thread
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(
+            lambda item: _download_one(item, upload_folder, image_pool),
+            selected_items))
     
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            raise Exception("No valid credentials for getting picked items")
+    for result in results:
+        if result is None:
+            continue
+        media, original_size, processed_size = result
+        # url_for needs the request context, which the worker threads don't have
+        media['url'] = url_for('uploaded_file', filename=media['filename'], _external=True)
+        imported_media.append(media)
+        total_original_size += original_size
+        total_processed_size += processed_size
     
-    headers = {
-        'Authorization': f'Bearer {creds.token}',
-        'Content-Type': 'application/json'
+    return {
+        'success': True,
+        'media': imported_media,
+        'count': len(imported_media),
+        'totalOriginalSize': total_original_size,
+        'totalProcessedSize': total_processed_size
     }
-    
-    # Get picked media items from Picker API
-    response = requests.get(
-        f'https://photospicker.googleapis.com/v1/mediaItems?sessionId={session_id}',
-        headers=headers
-    )
-    
-    if response.status_code == 401:
-        # Token expired, refresh and retry
-        creds.refresh(Request())
-        headers['Authorization'] = f'Bearer {creds.token}'
-        response = requests.get(
-            f'https://photospicker.googleapis.com/v1/mediaItems?sessionId={session_id}',
-            headers=headers
-        )
-    
-    if response.status_code == 200:
-        return response.json()
-    elif response.status_code == 400:
-        # This might be a FAILED_PRECONDITION error - user hasn't finished selecting
-        error_data = response.json()
-        if 'FAILED_PRECONDITION' in str(error_data):
-            return {'not_ready': True, 'error': error_data}
-        else:
-            raise Exception(f"Failed to get picked items: {response.status_code} - {response.text}")
-    else:
-        raise Exception(f"Failed to get picked items: {response.status_code} - {response.text}")
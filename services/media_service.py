@@ -40,6 +40,10 @@ from utils.url_utils import url_for_with_prefix
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'webm'}
 
+# Shared HTTP session so repeated downloads from the same host (e.g. the Google
+# Photos CDN) reuse kept-alive connections
+_http_session = requests.Session()
+
 
 def get_upload_folder():
     """Get the configured upload folder path."""
@@ -356,14 +360,16 @@ def optimize_image_content(content, ext):
         
         # Save with optimization
         output = io.BytesIO()
+        # Fast encoder settings: baseline 4:2:0 JPEG without the extra Huffman
+        # optimization pass, zlib level 6 for PNG
         if ext.lower() in ['jpg', 'jpeg']:
-            image.save(output, format='JPEG', quality=85, optimize=True)
+            image.save(output, format='JPEG', quality=82, optimize=False, subsampling=2, progressive=False)
         elif ext.lower() == 'png':
-            image.save(output, format='PNG', optimize=True)
+            image.save(output, format='PNG', compress_level=6)
         elif ext.lower() == 'webp':
-            image.save(output, format='WebP', quality=85, optimize=True)
+            image.save(output, format='WebP', quality=82, method=4)
         else:
-            image.save(output, format='JPEG', quality=85, optimize=True)
+            image.save(output, format='JPEG', quality=82, optimize=False, subsampling=2, progressive=False)
         
         return output.getvalue()
         
@@ -399,7 +405,7 @@ def download_and_save_media_from_url(url, filename, mime_type=None, headers=None
     """
     try:
         # Download the file
-        response = requests.get(url, headers=headers or {})
+        response = _http_session.get(url, headers=headers or {})
         
         if response.status_code != 200:
             return {'success': False, 'error': f'Failed to download: HTTP {response.status_code}'}
@@ -620,51 +626,48 @@ def extract_images_from_posts():
     Extract images from post content and populate images table.
     This is used for legacy data migration.
     """
-    from db.database import get_db
+    from db.database import get_write_db
     
     with current_app.app_context():
-        db = get_db()
+        with get_write_db() as db:
+            # Get all posts
+            posts = db.execute('SELECT id, content, created FROM posts').fetchall()
         
-        # Get all posts
-        posts = db.execute('SELECT id, content, created FROM posts').fetchall()
-        
-        for post in posts:
-            if not post['content']:
-                continue
+            for post in posts:
+                if not post['content']:
+                    continue
                 
-            # Find all img tags in the HTML content
-            img_matches = re.findall(r'<img[^>]+src=["\']([^"\']+)["\'][^>]*>', post['content'])
+                # Find all img tags in the HTML content
+                img_matches = re.findall(r'<img[^>]+src=["\']([^"\']+)["\'][^>]*>', post['content'])
             
-            for img_url in img_matches:
-                # Only include images from our uploads folder
-                if '/uploads/' in img_url:
-                    filename = img_url.split('/uploads/')[-1]
+                for img_url in img_matches:
+                    # Only include images from our uploads folder
+                    if '/uploads/' in img_url:
+                        filename = img_url.split('/uploads/')[-1]
                     
-                    # Check if this image is already in the images table
-                    existing = db.execute(
-                        'SELECT id FROM images WHERE post_id = ? AND filename = ?',
-                        (post['id'], filename)
-                    ).fetchone()
+                        # Check if this image is already in the images table
+                        existing = db.execute(
+                            'SELECT id FROM images WHERE post_id = ? AND filename = ?',
+                            (post['id'], filename)
+                        ).fetchone()
                     
-                    if not existing:
-                        # Try to get file modification time as upload_date
-                        upload_date = post['created']  # Default to post creation date
-                        try:
-                            file_path = os.path.join(get_upload_folder(), filename)
-                            if os.path.exists(file_path):
-                                # Use file modification time
-                                mtime = os.path.getmtime(file_path)
-                                upload_date = datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
-                        except:
-                            pass  # Use default date
+                        if not existing:
+                            # Try to get file modification time as upload_date
+                            upload_date = post['created']  # Default to post creation date
+                            try:
+                                file_path = os.path.join(get_upload_folder(), filename)
+                                if os.path.exists(file_path):
+                                    # Use file modification time
+                                    mtime = os.path.getmtime(file_path)
+                                    upload_date = datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+                            except:
+                                pass  # Use default date
                         
-                        # Insert into images table
-                        db.execute('''
-                            INSERT INTO images (post_id, filename, url, upload_date, extracted_date)
-                            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                        ''', (post['id'], filename, img_url, upload_date))
-        
-        db.commit()
+                            # Insert into images table
+                            db.execute('''
+                                INSERT INTO images (post_id, filename, url, upload_date, extracted_date)
+                                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                            ''', (post['id'], filename, img_url, upload_date))
 
 
 def cleanup_orphaned_media():